@@ -0,0 +1,171 @@
+"""
+Local fake of Binance spot streams: `SUBSCRIBE`/`UNSUBSCRIBE` of `<symbol>@aggTrade` streams over websocket,
+combined streams of `/stream?streams=...` and `/api/v3/exchangeInfo` over plain HTTP on the same port.
+
+Trades are generated at the given total rate over all symbols, synthetic or replayed from a recording, and every trade
+is sent to each connection subscribed to its symbol, with the same aggregate trade id. Event and trade times of every
+frame are set to the send time, so the consumer can measure freshness.
+
+Usage:
+    uv run python -m benchmarks.fake_binance --port 9443 --symbols 2000 --rate 100000
+"""
+import argparse
+import asyncio
+import gzip
+import re
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import ujson
+from loguru import logger
+from websockets import ConnectionClosed
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.datastructures import Headers
+from websockets.http11 import Request, Response
+
+_SEND_TICK = 0.01  # Trades are generated and sent by bursts every 10ms
+_GENERATED_FIELDS = re.compile(r'(?<="([EaT])":)\d+')  # Event time, aggregate trade id, trade time
+_SYMBOL_FIELD = re.compile(r'"s":"([A-Z0-9]+)"')
+
+type FrameTemplate = list[str]  # Parts of the frame interleaved with names of the generated fields
+
+
+def synthetic_symbols(count: int) -> list[str]:
+    return [f"BENCH{idx}USDT" for idx in range(count)]
+
+
+def read_replay(path: Path, limit: int = 1_000_000) -> list[str]:
+    """
+    Frames one per line, gzip compressed if the name ends with .gz.
+    Files recorded by quote_consumer (`TRADES_RECORD_DIR`) are read as well, frame is the last field of their lines.
+    Symbols are prefixed with BENCH, so candles of the replayed trades never overwrite the real ones in DB.
+    """
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt") as f:  # type: ignore[operator]
+        frames = [line.rstrip("\n").split("\t", 2)[-1] for line, _ in zip(f, range(limit), strict=False) if line.strip()]
+    # Frames of combined streams are unwrapped, they are wrapped again when sent to combined streams connection
+    frames = [ujson.dumps(ujson.loads(frame)["data"]) if frame.startswith('{"stream"') else frame for frame in frames]
+    return [_SYMBOL_FIELD.sub(_bench_symbol, frame, count=1) for frame in frames]
+
+
+def _bench_symbol(match: re.Match[str]) -> str:
+    symbol = match.group(1)
+    return match.group(0) if symbol.startswith("BENCH") else f'"s":"BENCH{symbol}"'
+
+
+def replay_symbols(frames: list[str]) -> list[str]:
+    return sorted({match.group(1) for frame in frames if (match := _SYMBOL_FIELD.search(frame))})
+
+
+class FakeBinance:
+    def __init__(self, symbols: list[str], rate: float, replay: list[str] | None = None) -> None:
+        self._symbols = symbols
+        self._rate = rate
+        self._replay: dict[str, list[FrameTemplate]] = {}
+        for frame in replay or []:
+            if match := _SYMBOL_FIELD.search(frame):
+                self._replay.setdefault(match.group(1), []).append(_GENERATED_FIELDS.split(frame))
+        self._exchange_info = ujson.dumps({
+            "symbols": [
+                {"symbol": symbol, "status": "TRADING", "baseAsset": symbol.removesuffix("USDT"), "quoteAsset": "USDT"}
+                for symbol in symbols
+            ]
+        }).encode()
+        self._subscribers: dict[ServerConnection, tuple[set[str], bool]] = {}  # Streams, combined streams or not
+        self.sent = 0
+
+    async def serve(self, host: str, port: int, ready: asyncio.Event | None = None) -> None:
+        async with serve(
+            self._handle, host, port, process_request=self._process_request, compression=None, max_queue=None
+        ) as server:
+            if ready is not None:
+                ready.set()
+            market = asyncio.create_task(self._send_trades())
+            try:
+                await server.serve_forever()
+            finally:
+                market.cancel()
+
+    def _process_request(self, _connection: ServerConnection, request: Request) -> Response | None:
+        if not request.path.startswith("/api/v3/exchangeInfo"):
+            return None
+        headers = Headers({
+            "Content-Type": "application/json",
+            "Content-Length": str(len(self._exchange_info)),
+            "Connection": "close",
+        })
+        return Response(200, "OK", headers, self._exchange_info)
+
+    async def _handle(self, conn: ServerConnection) -> None:
+        url = urlsplit(conn.request.path if conn.request else "")
+        streams = {
+            stream.split("@")[0].upper() for value in parse_qs(url.query).get("streams", []) for stream in value.split("/")
+        }
+        self._subscribers[conn] = (streams, url.path.startswith("/stream"))
+        try:
+            async for msg in conn:
+                request = ujson.loads(msg)
+                symbols = {param.split("@")[0].upper() for param in request.get("params", [])}
+                if request.get("method") == "SUBSCRIBE":
+                    streams |= symbols
+                elif request.get("method") == "UNSUBSCRIBE":
+                    streams -= symbols
+                await conn.send(ujson.dumps({"result": None, "id": request.get("id")}))
+        except ConnectionClosed:
+            pass
+        finally:
+            del self._subscribers[conn]
+
+    async def _send_trades(self) -> None:
+        seq, owed = 0, 0.0
+        while True:
+            t_start = time.monotonic()
+            owed += self._rate * _SEND_TICK
+            now = str(int(time.time() * 1000))
+            for _ in range(int(owed)):
+                seq += 1
+                symbol = self._symbols[seq % len(self._symbols)]
+                frame = ""
+                for conn, (streams, combined) in list(self._subscribers.items()):
+                    if symbol not in streams:
+                        continue
+                    frame = frame or self._frame(symbol, seq, now)
+                    try:
+                        await conn.send(f'{{"stream":"{symbol.lower()}@aggTrade","data":{frame}}}' if combined else frame)
+                    except ConnectionClosed:
+                        continue
+                    self.sent += 1
+            owed -= int(owed)
+            await asyncio.sleep(max(0.0, _SEND_TICK - (time.monotonic() - t_start)))
+
+    def _frame(self, symbol: str, seq: int, now: str) -> str:
+        """Trade ids are increasing over all symbols, so per symbol as well"""
+        if self._replay:
+            templates = self._replay[symbol]
+            values = {"E": now, "a": str(seq), "T": now}
+            template = templates[seq % len(templates)]
+            return "".join(values[part] if idx % 2 else part for idx, part in enumerate(template))
+        price = f"{100 + seq % 1000 / 100:.8f}"
+        return (
+            f'{{"e":"aggTrade","E":{now},"s":"{symbol}","a":{seq},"p":"{price}","q":"0.01000000",'
+            f'"f":{seq},"l":{seq},"T":{now},"m":false,"M":true}}'
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9443)
+    parser.add_argument("--symbols", type=int, default=2000, help="Synthetic symbols, ignored with --replay")
+    parser.add_argument("--rate", type=float, default=100_000, help="Trades per second over all symbols")
+    parser.add_argument("--replay", type=Path, help="Recorded frames, one per line, optionally gzipped")
+    args = parser.parse_args()
+    replay = read_replay(args.replay) if args.replay else None
+    symbols = replay_symbols(replay) if replay else synthetic_symbols(args.symbols)
+    logger.info(f"Serving {len(symbols)} symbols at {args.rate:,.0f} trades/s on {args.host}:{args.port}")
+    asyncio.run(FakeBinance(symbols, args.rate, replay).serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare flush of candles to Postgres: row by row executemany upsert vs binary COPY into staging table.
+
+Usage:
+    uv run python -m benchmarks.flush_to_db --tickers 2000 --seconds 30
+
+Candles are written into the 2001-01-01 partition of candles_1s table, which is dropped at the end.
+"""
+import argparse
+import asyncio
+import random
+from datetime import UTC, datetime, timedelta
+from time import monotonic
+
+from loguru import logger
+
+from db.repositories import DB
+from db.repositories.candles_1s.schema import CandleRecord
+from quote_consumer.core.settings import settings
+from schemas.types import Candle, Ticker
+
+_BASE_DT = datetime(2001, 1, 1, tzinfo=UTC)
+_BASE_T = int(_BASE_DT.timestamp())
+
+
+def _records(tickers: int, seconds: int) -> list[CandleRecord]:
+    records: list[CandleRecord] = []
+    for ticker_idx in range(tickers):
+        ticker = Ticker.build(f"BENCH{ticker_idx}USDT", "BINANCE")
+        for second in range(seconds):
+            price = round(random.uniform(0.0001, 100_000), 8)  # noqa: S311
+            records.append((ticker, _BASE_T + second, price, price, price, price, round(random.random() * 100, 8)))  # noqa: S311
+    return records
+
+
+async def _cleanup() -> None:
+    await DB.pool.execute("DELETE FROM candles_1s WHERE ticker LIKE 'BENCH%'")
+
+
+async def _run(tickers: int, seconds: int, repeat: int) -> None:
+    await DB.connect(dsn=str(settings.DB_SERVICE))
+    await DB.candles_1s.create_partitions(_BASE_DT.date(), _BASE_DT.date())
+    records = _records(tickers, seconds)
+    logger.info(f"Candles per flush: {len(records)}")
+    try:
+        for _ in range(repeat):
+            t_start = monotonic()
+            candles = [Candle.from_floats(tk, t, o=o, c=c, l=l, h=h, v=v) for tk, t, o, c, h, l, v in records]
+            await DB.candles_1s.bulk_upsert(candles)
+            executemany_elapsed = monotonic() - t_start
+            await _cleanup()
+
+            t_start = monotonic()
+            await DB.candles_1s.bulk_upsert_copy(records)
+            copy_elapsed = monotonic() - t_start
+            await _cleanup()
+
+            logger.info(
+                f"executemany: {executemany_elapsed:.3f}s ({len(records) / executemany_elapsed:,.0f} rows/s) | "
+                f"copy: {copy_elapsed:.3f}s ({len(records) / copy_elapsed:,.0f} rows/s) | "
+                f"speedup: x{executemany_elapsed / copy_elapsed:.1f}"
+            )
+    finally:
+        await DB.candles_1s.remove_old_candles(_BASE_DT + timedelta(days=1))
+        await DB.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", type=int, default=2000)
+    parser.add_argument("--seconds", type=int, default=30, help="Candles per ticker")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(_run(args.tickers, args.seconds, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+End to end benchmark of trades ingestion: Binance provider -> trades queue -> candles processor [-> DB flush].
+
+Fake Binance server runs in a separate process, consumer side runs the real provider and processor against it.
+Reports throughput, CPU per stage, freshness of the candles (trade time to candle update) and, with --db,
+flush throughput. Decode and candle stages are timed by wrapping them, which adds ~0.1us per call.
+
+Usage:
+    uv run python -m benchmarks.ingestion --symbols 2000 --rate 100000 --duration 30
+    uv run python -m benchmarks.ingestion --replay recording.jsonl.gz --rate 50000
+    uv run python -m benchmarks.ingestion --rate 20000 --db  # Flushes into DB configured in .env
+    TRADES_REDUNDANT_CONNECTIONS=true uv run python -m benchmarks.ingestion  # Standby connections, deduplicated
+
+With --db candles of BENCH* tickers are written into the candle tables and deleted at the end. Replayed symbols are
+prefixed with BENCH as well.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+from collections.abc import Callable
+from pathlib import Path
+from statistics import quantiles
+from typing import Any
+
+from loguru import logger
+
+from benchmarks.fake_binance import FakeBinance, read_replay, replay_symbols, synthetic_symbols
+from db.repositories import DB
+from quote_consumer.candle_processor import FLUSH_CANDLES, FLUSH_DURATION, TRADES_PROCESSED, TradesToCandleProcessor
+from quote_consumer.core.settings import settings
+from quote_consumer.ws_connector.base import TRADES_DROPPED, TRADES_DUPLICATE, TRADES_RECEIVED, RTTradesProvider
+from quote_consumer.ws_connector.binance import BinanceRTTradesProvider, BinanceTradePayload
+from schemas.types import RawTrade
+
+_HOST = "127.0.0.1"
+
+
+class _Stage:
+    """Accumulated time of the wrapped calls, the stages are synchronous so it is CPU time of the loop thread"""
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.calls = 0
+
+    def wrap[**P, R](self, func: Callable[P, R]) -> Callable[P, R]:
+        def timed(*args: P.args, **kwargs: P.kwargs) -> R:
+            t_start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - t_start
+                self.calls += 1
+        return timed
+
+
+def _serve(args: argparse.Namespace, symbols: list[str], ready: Any, stats: Any) -> None:
+    async def serve() -> None:
+        fake = FakeBinance(symbols, args.rate, read_replay(args.replay) if args.replay else None)
+        server = asyncio.create_task(fake.serve(_HOST, args.port))
+        await asyncio.sleep(0.2)
+        ready.set()
+        while not server.done():
+            await asyncio.sleep(0.5)
+            stats["sent"], stats["cpu"] = fake.sent, time.process_time()
+        await server
+    asyncio.run(serve())
+
+
+async def _run(args: argparse.Namespace) -> None:
+    symbols = replay_symbols(read_replay(args.replay)) if args.replay else synthetic_symbols(args.symbols)
+    manager = multiprocessing.Manager()
+    ready, server_stats = manager.Event(), manager.dict(sent=0, cpu=0.0)
+    server = multiprocessing.Process(
+        target=_serve, args=(args, symbols, ready, server_stats), daemon=True
+    )
+    server.start()
+    await asyncio.to_thread(ready.wait)
+
+    BinanceRTTradesProvider.ws_url = f"ws://{_HOST}:{args.port}/ws"
+    BinanceRTTradesProvider.combined_ws_url = f"ws://{_HOST}:{args.port}/stream"
+    BinanceRTTradesProvider.exchange_info_url = f"http://{_HOST}:{args.port}/api/v3/exchangeInfo"
+    BinanceRTTradesProvider.SUB_DELAY = 0.01
+    decode_stage, candles_stage = _Stage(), _Stage()
+    BinanceTradePayload.decode = decode_stage.wrap(BinanceTradePayload.decode)  # type: ignore[method-assign]
+
+    queue = RTTradesProvider.get_trade_queue()
+    processor = TradesToCandleProcessor(queue, remove_old_candles=False)
+    add_trades = candles_stage.wrap(processor._add_trades)  # noqa: SLF001
+    lags: list[float] = []  # Trade time to candle update, last trade of every batch
+
+    def add_trades_with_lag(trades: list[RawTrade]) -> None:
+        add_trades(trades)
+        if trades:
+            lags.append(time.time() - trades[-1][1] / 1000)
+
+    processor._add_trades = add_trades_with_lag  # type: ignore[method-assign]  # noqa: SLF001
+    if args.db:
+        await DB.connect(dsn=str(settings.DB_SERVICE), pools=settings.DB_POOLS)
+        processor_task = asyncio.create_task(processor.run())
+    else:
+        processor_task = asyncio.create_task(processor._trades_to_buffer_processor())  # noqa: SLF001
+    provider_task = asyncio.create_task(RTTradesProvider.run())
+
+    await asyncio.sleep(args.warmup)
+    start = _snapshot(server_stats, decode_stage, candles_stage)
+    lags.clear()
+    await asyncio.sleep(args.duration)
+    end = _snapshot(server_stats, decode_stage, candles_stage)
+
+    provider_task.cancel()
+    await RTTradesProvider.stop()
+    processor_task.cancel()
+    server.terminate()
+    if args.db:
+        await processor.stop()
+        for table in ("candles_1s", "candles_1m", "candles_1h"):
+            await DB.pool.execute(f"DELETE FROM {table} WHERE ticker LIKE 'BENCH%'")  # noqa: S608
+        await DB.disconnect()
+    _report(args, start, end, lags)
+
+
+def _snapshot(server_stats: Any, decode_stage: _Stage, candles_stage: _Stage) -> dict[str, float]:
+    return {
+        "wall": time.monotonic(),
+        "cpu": time.process_time(),
+        "server_sent": server_stats["sent"],
+        "server_cpu": server_stats["cpu"],
+        "received": sum(sample.value for sample in TRADES_RECEIVED.collect().samples),
+        "processed": TRADES_PROCESSED.labels().value,
+        "dropped": TRADES_DROPPED.labels().value,
+        "duplicate": TRADES_DUPLICATE.labels().value,
+        "decode_seconds": decode_stage.seconds,
+        "decode_calls": decode_stage.calls,
+        "candles_seconds": candles_stage.seconds,
+        "flushed": sum(child.sum for _, child in FLUSH_CANDLES.series()),
+        "flush_seconds": sum(child.sum for _, child in FLUSH_DURATION.series()),
+    }
+
+
+def _report(args: argparse.Namespace, start: dict[str, float], end: dict[str, float], lags: list[float]) -> None:
+    delta = {name: end[name] - start[name] for name in start}
+    wall = delta["wall"]
+    processed = delta["processed"]
+    logger.info(f"Target rate: {args.rate:,.0f} trades/s. Measured for {wall:.1f}s")
+    logger.info(
+        f"Sent: {delta['server_sent'] / wall:,.0f}/s | received: {delta['received'] / wall:,.0f}/s | "
+        f"processed: {processed / wall:,.0f}/s | dropped: {delta['dropped']:,.0f} | "
+        f"duplicate: {delta['duplicate'] / wall:,.0f}/s"
+    )
+    other_cpu = delta["cpu"] - delta["decode_seconds"] - delta["candles_seconds"]
+    logger.info(
+        f"Consumer CPU: {delta['cpu'] / wall:.0%} | "
+        f"decode: {delta['decode_seconds'] / max(delta['decode_calls'], 1) * 1e6:.2f}us/msg | "
+        f"candles: {delta['candles_seconds'] / max(processed, 1) * 1e6:.2f}us/trade | "
+        f"websocket, batching and rest: {other_cpu / wall:.0%} | server CPU: {delta['server_cpu'] / wall:.0%}"
+    )
+    if len(lags) >= 2:  # noqa: PLR2004
+        p50, p95, p99 = (quantiles(lags, n=100)[idx] for idx in (49, 94, 98))
+        logger.info(f"Freshness, trade time to candle: p50 {p50 * 1000:.1f}ms | p95 {p95 * 1000:.1f}ms | p99 {p99 * 1000:.1f}ms")
+    if args.db and delta["flush_seconds"]:
+        logger.info(
+            f"Flushed: {delta['flushed']:,.0f} candles in {delta['flush_seconds']:.2f}s "
+            f"({delta['flushed'] / delta['flush_seconds']:,.0f} candles/s)"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=2000, help="Synthetic symbols, ignored with --replay")
+    parser.add_argument("--rate", type=float, default=100_000, help="Trades per second sent by the fake server")
+    parser.add_argument("--replay", type=Path, help="Recorded frames, one per line, optionally gzipped")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="Seconds before measuring, connections are set up")
+    parser.add_argument("--port", type=int, default=19443)
+    parser.add_argument("--db", action="store_true", help="Run flushes against the DB configured in .env")
+    args = parser.parse_args()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
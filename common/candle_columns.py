@@ -0,0 +1,59 @@
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterator
+
+from schemas.types import Ticker
+
+# Chunked columnar stream of candles. Chunk holds candles of a single ticker ordered by time:
+# header (ticker length, candles count), utf-8 ticker, then int64 t and float64 o, h, l, c, v columns, little endian.
+# Columns are plain buffers, clients load them without per row parsing, e.g. `numpy.frombuffer(data, "<f8", count, offset)`.
+MEDIA_TYPE = "application/vnd.candles.columnar"
+_CHUNK_HEADER = struct.Struct("<HI")  # ticker length, candles count
+_TYPECODES = "qddddd"
+
+type CandleColumns = tuple[array[int], array[float], array[float], array[float], array[float], array[float]]  # t, o, h, l, c, v
+
+
+def empty_columns() -> CandleColumns:
+    return array("q"), array("d"), array("d"), array("d"), array("d"), array("d")
+
+
+def slice_columns(columns: CandleColumns, from_: int, till: int) -> CandleColumns:
+    """Candles in [from_, till) of the time ordered columns"""
+    start, end = bisect_left(columns[0], from_), bisect_left(columns[0], till)
+    return tuple(column[start:end] for column in columns)  # type: ignore[return-value]
+
+
+def encode_chunk(ticker: Ticker, columns: CandleColumns) -> bytes:
+    encoded = ticker.encode()
+    parts = [_CHUNK_HEADER.pack(len(encoded), len(columns[0])), encoded]
+    for column in columns:
+        if sys.byteorder == "big":
+            column = array(column.typecode, column)  # noqa: PLW2901
+            column.byteswap()
+        parts.append(column.tobytes())
+    return b"".join(parts)
+
+
+def iter_chunks(data: bytes | memoryview) -> Iterator[tuple[Ticker, CandleColumns]]:
+    """Decode the stream, chunks of a ticker come in time order"""
+    data, offset = memoryview(data), 0
+    while offset < len(data):
+        ticker_len, count = _CHUNK_HEADER.unpack_from(data, offset)
+        offset += _CHUNK_HEADER.size
+        ticker = Ticker(bytes(data[offset:offset + ticker_len]).decode())
+        offset += ticker_len
+        columns = []
+        for typecode in _TYPECODES:
+            column = array(typecode)
+            size = count * column.itemsize
+            if offset + size > len(data):
+                raise ValueError("Truncated candles chunk")
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns.append(column)
+            offset += size
+        yield ticker, tuple(columns)  # type: ignore[misc]
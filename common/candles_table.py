@@ -0,0 +1,169 @@
+import mmap
+import struct
+import time
+from pathlib import Path
+from zlib import crc32
+
+from schemas.types import Ticker
+
+# Memory mapped table with the latest candle per ticker shared by quote consumer (single writer per file)
+# and currency conversion (readers) running on the same host. One file per quote consumer shard.
+# Every slot is protected by a seqlock: sequence is odd while slot is written, readers retry on change.
+_MAGIC = b"CNDLTBL1"
+_HEADER = struct.Struct("<8sIId")  # magic, shards, capacity, heartbeat
+_HEARTBEAT = struct.Struct("<d")
+_HEARTBEAT_OFFSET = 16
+_SLOT = struct.Struct("<Q32sq5d")  # sequence, ticker, t, o, c, l, h, v
+_SLOT_KEY = struct.Struct("<Q32s")  # sequence, ticker
+_SEQUENCE = struct.Struct("<Q")
+_TICKER_SIZE = 32
+_READ_ATTEMPTS = 10
+
+CAPACITY = 8192  # Slots per table file, must be a power of two
+
+type CandleRow = tuple[int, float, float, float, float, float]  # t, o, c, l, h, v
+
+
+class CandlesTableUnavailableError(Exception):
+    ...
+
+
+def table_path(directory: str | Path, shard: int) -> Path:
+    return Path(directory) / f"candles_{shard}.tbl"
+
+
+def _slot_offset(slot: int) -> int:
+    return _HEADER.size + slot * _SLOT.size
+
+
+class CandlesTableWriter:
+    """Publishes the latest candles of the tickers owned by the process"""
+
+    def __init__(self, path: Path, shards: int = 1, capacity: int = CAPACITY) -> None:
+        self._capacity = capacity
+        self._slots: dict[Ticker, int] = {}
+        # Brand new file replaces the previous one, so readers of the old file see it stale and reopen
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("wb") as f:
+            f.write(_HEADER.pack(_MAGIC, shards, capacity, time.time()))
+            f.truncate(_slot_offset(capacity))
+        tmp_path.replace(path)
+        with path.open("r+b") as f:
+            self._mm = mmap.mmap(f.fileno(), 0)
+
+    def publish(self, ticker: Ticker, row: CandleRow) -> bool:
+        """Write the latest candle of the ticker. False if ticker cannot be placed into the table."""
+        if (slot := self._slots.get(ticker)) is None and (slot := self._allocate(ticker)) is None:
+            return False
+        offset = _slot_offset(slot)
+        (sequence,) = _SEQUENCE.unpack_from(self._mm, offset)
+        _SEQUENCE.pack_into(self._mm, offset, sequence + 1)
+        _SLOT.pack_into(self._mm, offset, sequence + 1, ticker.encode(), *row)
+        _SEQUENCE.pack_into(self._mm, offset, sequence + 2)
+        return True
+
+    def heartbeat(self) -> None:
+        _HEARTBEAT.pack_into(self._mm, _HEARTBEAT_OFFSET, time.time())
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _allocate(self, ticker: Ticker) -> int | None:
+        encoded = ticker.encode()
+        if len(encoded) > _TICKER_SIZE:
+            return None
+        mask = self._capacity - 1
+        slot = crc32(encoded) & mask
+        for _ in range(self._capacity):
+            # Slots are only taken, never released, so never written slot is a free one
+            sequence, _ = _SLOT_KEY.unpack_from(self._mm, _slot_offset(slot))
+            if sequence == 0:
+                self._slots[ticker] = slot
+                return slot
+            slot = (slot + 1) & mask
+        return None
+
+
+class _TableFile:
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.shards, self.capacity, _ = _HEADER.unpack_from(self.mm)
+        if magic != _MAGIC:
+            self.mm.close()
+            raise CandlesTableUnavailableError(f"{path} is not a candles table")
+        self.slots: dict[Ticker, int] = {}
+
+    def heartbeat(self) -> float:
+        return _HEARTBEAT.unpack_from(self.mm, _HEARTBEAT_OFFSET)[0]
+
+    def read(self, ticker: Ticker) -> CandleRow | None:
+        encoded = ticker.encode().ljust(_TICKER_SIZE, b"\0")
+        if (slot := self.slots.get(ticker)) is not None:
+            return self._read_slot(slot, encoded)
+        mask = self.capacity - 1
+        slot = crc32(ticker.encode()) & mask
+        for _ in range(self.capacity):
+            sequence, slot_ticker = _SLOT_KEY.unpack_from(self.mm, _slot_offset(slot))
+            if sequence == 0:
+                return None
+            if slot_ticker == encoded:
+                self.slots[ticker] = slot
+                return self._read_slot(slot, encoded)
+            slot = (slot + 1) & mask
+        return None
+
+    def _read_slot(self, slot: int, encoded: bytes) -> CandleRow | None:
+        offset = _slot_offset(slot)
+        for _ in range(_READ_ATTEMPTS):
+            sequence, slot_ticker, *row = _SLOT.unpack_from(self.mm, offset)
+            if sequence % 2 == 0 and _SEQUENCE.unpack_from(self.mm, offset)[0] == sequence:
+                return tuple(row) if slot_ticker == encoded else None  # type: ignore
+        return None
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+class CandlesTableReader:
+    """Zero copy lookups of the latest candles published by quote consumer processes"""
+
+    def __init__(self, directory: str | Path, max_staleness: float = 5.0, reopen_period: float = 1.0) -> None:
+        self._directory = directory
+        self._max_staleness = max_staleness
+        self._reopen_period = reopen_period
+        self._tables: list[_TableFile] = []
+        self._opened_at = 0.0
+
+    def get(self, ticker: Ticker) -> CandleRow | None:
+        """
+        Latest candle of the ticker, None if ticker is not published.
+        Raises CandlesTableUnavailableError if table is missing or not updated by the writer.
+        """
+        now = time.time()
+        if not self._tables or now - self._tables[0].heartbeat() > self._max_staleness:
+            self._reopen(now)
+        table = self._tables[ticker.shard(len(self._tables))]
+        if now - table.heartbeat() > self._max_staleness:
+            raise CandlesTableUnavailableError("Candles table is stale")
+        return table.read(ticker)
+
+    def _reopen(self, now: float) -> None:
+        if now - self._opened_at < self._reopen_period:
+            if not self._tables:
+                raise CandlesTableUnavailableError("Candles table is not available")
+            return
+        self._opened_at = now
+        for table in self._tables:
+            table.close()
+        self._tables = []
+        try:
+            self._tables.append(_TableFile(table_path(self._directory, 0)))
+            for shard in range(1, self._tables[0].shards):
+                self._tables.append(_TableFile(table_path(self._directory, shard)))
+        except (OSError, ValueError, struct.error) as ex:
+            for table in self._tables:
+                table.close()
+            self._tables = []
+            raise CandlesTableUnavailableError from ex
+
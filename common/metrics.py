@@ -0,0 +1,226 @@
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Sequence
+from typing import ClassVar, NamedTuple
+
+# Metrics in Prometheus text exposition format, without the client library.
+# Hot paths resolve the labeled child once and then only add to its plain attributes.
+
+LATENCY_BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+SIZE_BUCKETS: tuple[float, ...] = (10, 100, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+type Labels = tuple[tuple[str, str], ...]
+
+
+class Sample(NamedTuple):
+    suffix: str  # Appended to the family name, e.g. "_bucket"
+    labels: Labels
+    value: float
+
+
+class MetricFamily(NamedTuple):
+    name: str
+    type: str
+    documentation: str
+    samples: list[Sample]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: "Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def collect(self) -> list[MetricFamily]:
+        return [metric.collect() for metric in self._metrics.values()]
+
+
+REGISTRY = Registry()
+
+
+class Metric[C]:
+    type: ClassVar[str]
+    family_suffix: ClassVar[str] = ""  # Appended to the name, TYPE and HELP lines must name the family as its samples
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = (), registry: Registry | None = REGISTRY
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._children: dict[tuple[str, ...], C] = {}
+        self._function: Callable[[], Iterable[tuple[tuple[str, ...], float]]] | None = None
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values: str) -> C:
+        """Child of the label values, keep it to skip the lookup on hot paths"""
+        if (child := self._children.get(values)) is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"Metric {self.name} has labels {self.label_names}")
+            self._children[values] = child = self._new_child()
+        return child
+
+    def set_function(self, function: Callable[[], Iterable[tuple[tuple[str, ...], float]]]) -> None:
+        """Values are read on collect from the (label values, value) pairs of the function instead of the children"""
+        self._function = function
+
+    def collect(self) -> MetricFamily:
+        samples: list[Sample] = []
+        name = f"{self.name}{self.family_suffix}"
+        if self._function is not None:
+            for values, value in self._function():
+                samples.append(Sample("", tuple(zip(self.label_names, values, strict=True)), value))
+            return MetricFamily(name, self.type, self.documentation, samples)
+        for values, child in self._children.items():
+            samples.extend(self._child_samples(tuple(zip(self.label_names, values, strict=True)), child))
+        return MetricFamily(name, self.type, self.documentation, samples)
+
+    def _new_child(self) -> C:  # type: ignore
+        """Child holding the values of a label values combination."""
+
+    def _child_samples(self, labels: Labels, child: C) -> Iterable[Sample]:  # type: ignore
+        """Samples of the child in exposition order."""
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(Metric[CounterChild]):
+    type = "counter"
+    family_suffix = "_total"
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def _child_samples(self, labels: Labels, child: CounterChild) -> Iterable[Sample]:
+        yield Sample("", labels, child.value)
+
+
+class GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(Metric[GaugeChild]):
+    type = "gauge"
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def _child_samples(self, labels: Labels, child: GaugeChild) -> Iterable[Sample]:
+        yield Sample("", labels, child.value)
+
+
+class HistogramChild:
+    """Bucket counts are not cumulative, the last bucket is +Inf"""
+
+    __slots__ = ("bucket_counts", "buckets", "count", "sum")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Histogram(Metric[HistogramChild]):
+    """Buckets are inclusive upper bounds"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        registry: Registry | None = REGISTRY,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = buckets
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def series(self) -> Iterable[tuple[tuple[str, ...], HistogramChild]]:
+        return self._children.items()
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def _child_samples(self, labels: Labels, child: HistogramChild) -> Iterable[Sample]:
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), child.bucket_counts, strict=True):
+            cumulative += count
+            yield Sample("_bucket", (*labels, ("le", _format_value(bound))), cumulative)
+        yield Sample("_sum", labels, child.sum)
+        yield Sample("_count", labels, child.count)
+
+
+def with_labels(families: Iterable[MetricFamily], labels: Labels) -> list[MetricFamily]:
+    """Families with extra labels on every sample, e.g. the shard they are collected from"""
+    return [
+        family._replace(samples=[sample._replace(labels=(*labels, *sample.labels)) for sample in family.samples])
+        for family in families
+    ]
+
+
+def render(families: Iterable[MetricFamily]) -> str:
+    """Text exposition, samples of families with the same name are merged"""
+    merged: dict[str, MetricFamily] = {}
+    for family in families:
+        if (existing := merged.get(family.name)) is None:
+            merged[family.name] = family._replace(samples=list(family.samples))
+        else:
+            existing.samples.extend(family.samples)
+    lines: list[str] = []
+    for family in merged.values():
+        lines.append(f"# HELP {family.name} {family.documentation}")
+        lines.append(f"# TYPE {family.name} {family.type}")
+        for suffix, labels, value in family.samples:
+            lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return f"{{{pairs}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
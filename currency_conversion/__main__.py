@@ -1,10 +1,14 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
+from common.metrics import CONTENT_TYPE, REGISTRY, render
 from currency_conversion.api.api import router as api
 from currency_conversion.core.events import LifeSpan
+from currency_conversion.core.middlewares import RequestMetricsMiddleware
 from currency_conversion.core.settings import settings
+from currency_conversion.services.quotes import QuoteService
+from db.repositories import DB
 
 app = FastAPI(debug=settings.DEBUG, lifespan=LifeSpan)
 
@@ -15,12 +19,23 @@ app.add_middleware(
     allow_methods=["*"],
     allow_credentials=True,
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 @app.get("/health", tags=["system"], include_in_schema=False)
 async def health_check() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/stats", tags=["system"], include_in_schema=False)
+async def quote_stats() -> dict[str, int]:
+    return QuoteService.get_stats() | DB.get_stats()
+
+
+@app.get("/metrics", tags=["system"], include_in_schema=False)
+async def metrics() -> Response:
+    return Response(render(REGISTRY.collect()), media_type=CONTENT_TYPE)
+
+
 app.include_router(api)
 
 if __name__ == "__main__":
@@ -1,25 +1,43 @@
+from collections.abc import Iterator
 from datetime import UTC, datetime, timedelta
 from decimal import Decimal
 
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
-from starlette.status import HTTP_404_NOT_FOUND
+from fastapi import APIRouter, Body, HTTPException, Query
+from pydantic import BaseModel, ConfigDict, Field
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
 
-from currency_conversion.services.quote_consumer import (
-    InMemoryQuoteService,
-    InMemoryQuoteServiceError,
-)
-from db.repositories import DB
-from schemas.types import Ticker, Timestamp
+from currency_conversion.services.conversion_graph import ConversionGraphService, Route
+from currency_conversion.services.quote_cache import CandleKey
+from currency_conversion.services.quotes import QuoteService
+from schemas.types import CANDLES_BATCH_MAX_SIZE, Candle, Timestamp
 
 router = APIRouter()
 
+MAX_BATCH_SIZE = 10_000
+# Routes have up to 3 legs, prices of a batch are looked up with at most 2 requests to quote consumer
+MAX_BATCH_LOOKUPS = 2 * CANDLES_BATCH_MAX_SIZE
+
 
 class _Quote(BaseModel):
     amount: Decimal
     conversion_rate: Decimal
 
 
+class _Conversion(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    amount: Decimal = Field(..., gt=0)
+    from_: str = Field(..., alias="from", examples=["BTC"])
+    to: str = Field(..., examples=["USDT"])
+    timestamp: Timestamp | None = None
+
+
+class _BatchQuote(BaseModel):
+    amount: Decimal | None = None
+    conversion_rate: Decimal | None = None
+    error: str | None = None
+
+
 @router.get("", responses={HTTP_404_NOT_FOUND: {"model": None, "description": "For outdated prices or missing prices"}})
 async def get_quote(
     amount: Decimal = Query(..., gt=0),
@@ -29,19 +47,66 @@ async def get_quote(
 ) -> _Quote:
     """
     Get Quote of conversion from latest price.
-    In case if timestamp is specified, will use closest to provided timestamp price
+    In case if timestamp is specified, will use closest to provided timestamp price.
+    Assets without direct market are converted through USDT, BTC or ETH.
     """
-    # NOTE: Assuming for now that only Binance exchange exists
-    ticker = Ticker.build(f"{from_.upper()}{to.upper()}", "BINANCE")
-    try:
-        candle = await InMemoryQuoteService.get_in_memory_candle(ticker, timestamp)
-    except InMemoryQuoteServiceError:
-        candle = await DB.candles_1s.get_latest_candle(ticker=ticker, timestamp=timestamp)  # type: ignore
-
-    if candle is None:
+    if (route := ConversionGraphService.route(from_.upper(), to.upper())) is None:
         raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="conversion_not_possible")
 
-    if timestamp is None and candle.t < datetime.now(tz=UTC) - timedelta(minutes=1):
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="quotes_outdated")
+    lookups = list(_route_lookups(route, timestamp))
+    rate = _route_rate(route, timestamp, dict(zip(lookups, await QuoteService.get_candles(lookups), strict=True)))
+    if isinstance(rate, str):
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=rate)
+
+    return _Quote(amount=amount*rate, conversion_rate=rate)
+
+
+@router.post("/batch")
+async def get_quotes_batch(conversions: list[_Conversion] = Body(..., max_length=MAX_BATCH_SIZE)) -> list[_BatchQuote]:
+    """
+    Get Quotes of many conversions in one request, each resolved the same way as single conversion.
+    Prices are looked up with single request to quote consumer and single DB query for the missing ones.
+    Results are in the order of conversions, conversion which is not possible has the reason as error.
+    Batch needing more than `MAX_BATCH_LOOKUPS` distinct prices is rejected.
+    """
+    routes = [ConversionGraphService.route(conv.from_.upper(), conv.to.upper()) for conv in conversions]
+    # Legs shared by conversions are looked up once
+    lookups = list(dict.fromkeys(
+        lookup
+        for conv, route in zip(conversions, routes, strict=True) if route is not None
+        for lookup in _route_lookups(route, conv.timestamp)
+    ))
+    if len(lookups) > MAX_BATCH_LOOKUPS:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="too_many_lookups")
+    candles = dict(zip(lookups, await QuoteService.get_candles(lookups), strict=True))
+
+    quotes: list[_BatchQuote] = []
+    for conv, route in zip(conversions, routes, strict=True):
+        if route is None:
+            quotes.append(_BatchQuote(error="conversion_not_possible"))
+        elif isinstance(rate := _route_rate(route, conv.timestamp, candles), str):
+            quotes.append(_BatchQuote(error=rate))
+        else:
+            quotes.append(_BatchQuote(amount=conv.amount*rate, conversion_rate=rate))
+    return quotes
+
+
+def _route_lookups(route: Route, timestamp: Timestamp | None) -> Iterator[CandleKey]:
+    return ((leg.ticker, timestamp) for leg in route)
+
+
+def _route_rate(route: Route, timestamp: Timestamp | None, candles: dict[CandleKey, Candle | None]) -> Decimal | str:
+    """Conversion rate along the route or the reason conversion is not possible"""
+    rate = Decimal(1)
+    for leg in route:
+        if (candle := candles[leg.ticker, timestamp]) is None or not candle.c:
+            return "conversion_not_possible"
+        if _is_outdated(candle, timestamp):
+            return "quotes_outdated"
+        rate *= leg.rate(candle.c)
+    return rate
+
 
-    return _Quote(amount=amount*candle.c, conversion_rate=candle.c)
+def _is_outdated(candle: Candle, timestamp: Timestamp | None) -> bool:
+    """Latest price must be fresh, price at timestamp is the closest older one whatever old it is"""
+    return timestamp is None and candle.t < datetime.now(tz=UTC) - timedelta(minutes=1)
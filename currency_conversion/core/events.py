@@ -1,25 +1,41 @@
 
+import asyncio
 from types import TracebackType
 
 from fastapi import FastAPI
 from loguru import logger
 
 from currency_conversion.core.settings import settings
+from currency_conversion.services.candles_feed import CandlesFeedReplica
+from currency_conversion.services.conversion_graph import ConversionGraphService
 from db.repositories import DB
 
 
 class LifeSpan:
+    _graph_refresher: asyncio.Task[None]
+    _feed_replica: asyncio.Task[None] | None = None
+
     def __init__(self, app: FastAPI) -> None:
         self._app = app
 
     async def __aenter__(self) -> dict:
         logger.info("Stating application")
-        await DB.connect(dsn=str(settings.DB_SERVICE))
+        await DB.connect(dsn=str(settings.DB_SERVICE), pools=settings.DB_POOLS)
+        self._graph_refresher = asyncio.create_task(
+            ConversionGraphService.periodic_refresh(settings.MARKETS_REFRESH_PERIOD)
+        )
+        if settings.CANDLES_FEED_URL:
+            self._feed_replica = asyncio.create_task(
+                CandlesFeedReplica.run(settings.CANDLES_FEED_URL, settings.CANDLES_FEED_MAX_STALENESS)
+            )
         return {}
 
     async def __aexit__(
         self, exc_type: type[BaseException] | None, exc_val: BaseException | None, traceback: TracebackType | None
     ) -> None:
         logger.info("Stopping application")
+        self._graph_refresher.cancel()
+        if self._feed_replica is not None:
+            self._feed_replica.cancel()
         await DB.disconnect()
 
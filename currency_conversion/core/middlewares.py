@@ -0,0 +1,37 @@
+from time import monotonic
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.metrics import Histogram
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route", ["method", "route", "status"]
+)
+
+
+class RequestMetricsMiddleware:
+    """Plain ASGI middleware, so timing does not add a task per request"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t_start = monotonic()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route template is set by the router, so paths with different values share the series
+            route = route_.path if (route_ := scope.get("route")) is not None else "unmatched"
+            REQUEST_DURATION.labels(scope["method"], route, str(status)).observe(monotonic() - t_start)
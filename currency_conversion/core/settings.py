@@ -1,15 +1,29 @@
 from pydantic import Field, HttpUrl, PostgresDsn
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from db.repositories.base import DBLane, PoolConfigs
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="UTF-8", extra="ignore")
 
     DEBUG: bool = True
     DB_SERVICE: PostgresDsn
+    # Only fallback lookups of the latest candles, which must fail fast rather than queue up
+    DB_POOLS: dict[DBLane, PoolConfigs] = {DBLane.DEFAULT: PoolConfigs(min_size=2, max_size=10, statement_timeout=2)}
     ALLOWED_ORIGINS: list[str] = ["*"]
     APP_PORT: int = Field(9000, validation_alias="CURRENCY_CONVERSION_APP_PORT")
     QUOTE_CONSUMER_SERVICE: HttpUrl = HttpUrl("http://localhost:9005")
+    # Shared memory table of latest candles published by quote consumer on the same host. Disabled if not set
+    CANDLES_TABLE_DIR: str | None = None
+    QUOTE_CACHE_SIZE: int = 100_000  # Candles cached per process, the least recently used are evicted
+    QUOTE_CACHE_LATEST_TTL: float = 0.25  # Latest candles are cached for 250ms
+    QUOTE_CACHE_FINAL_AFTER: int = 60  # Candles of timestamps older than a minute are final
+    QUOTE_CACHE_FINAL_TTL: float = 60  # Final candles are cached for a minute, late DB writes are seen after it
+    # Latest candles are answered from the local replica kept by the quote consumer feed. Disabled if not set
+    CANDLES_FEED_URL: str | None = None
+    CANDLES_FEED_MAX_STALENESS: float = 3.0  # Replica is not used when no update came for 3 seconds
+    MARKETS_REFRESH_PERIOD: float = 300  # Conversion graph is rebuilt when markets of quote consumer change
 
 
 settings = Settings()  # type: ignore
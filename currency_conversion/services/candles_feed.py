@@ -0,0 +1,81 @@
+import asyncio
+import time
+import traceback
+from typing import ClassVar
+
+import ujson
+from loguru import logger
+from websockets import ConnectionClosed
+from websockets.asyncio.client import connect
+
+from common.candles_table import CandleRow
+from common.metrics import Gauge
+from schemas.types import Candle, Ticker
+
+REPLICA_AGE = Gauge("candles_feed_replica_age_seconds", "Time since the last update of the latest candles replica")
+
+
+class CandlesFeedReplica:
+    """
+    Local replica of the latest candles kept up to date by the quote consumer feed.
+    Replica is not used once no frame came for longer than max staleness, feed pushes frame every second.
+    """
+
+    _rows: ClassVar[dict[Ticker, CandleRow]] = {}
+    _candles: ClassVar[dict[Ticker, Candle]] = {}  # Candles built from the rows on first lookup
+    _updated_at: ClassVar[float] = 0.0  # Monotonic time of the last frame
+    _max_staleness: ClassVar[float] = 3.0
+
+    @classmethod
+    def get(cls, ticker: Ticker) -> Candle | None:
+        """Latest candle of the ticker, None if replica does not have it or is stale"""
+        if time.monotonic() - cls._updated_at > cls._max_staleness:
+            return None
+        if (candle := cls._candles.get(ticker)) is not None:
+            return candle
+        if (row := cls._rows.get(ticker)) is None:
+            return None
+        t, o, c, l, h, v = row
+        cls._candles[ticker] = candle = Candle.from_floats(ticker, t, o=o, c=c, l=l, h=h, v=v)
+        return candle
+
+    @classmethod
+    def get_stats(cls) -> dict[str, int]:
+        age_ms = int((time.monotonic() - cls._updated_at) * 1000) if cls._updated_at else -1
+        return {"feed_replica_tickers": len(cls._rows), "feed_replica_age_ms": age_ms}
+
+    @classmethod
+    def age(cls) -> list[tuple[tuple[()], float]]:
+        return [((), time.monotonic() - cls._updated_at if cls._updated_at else float("inf"))]
+
+    @classmethod
+    async def run(cls, url: str, max_staleness: float) -> None:
+        cls._max_staleness = max_staleness
+        # NOTE: There is a build in exponential backoff
+        async for conn in connect(url):
+            logger.info(f"Subscribed to candles feed: {url}")
+            try:
+                async for msg in conn:
+                    cls._apply(ujson.loads(msg))
+            except ConnectionClosed:
+                logger.info("Candles feed connection lost")
+            except Exception as ex:
+                logger.error(f"Critical error on candles feed: {ex}")
+                logger.error(traceback.format_exc())
+                await asyncio.sleep(max_staleness)
+
+    @classmethod
+    def _apply(cls, frame: dict) -> None:
+        rows: dict[Ticker, CandleRow] = {
+            Ticker(ticker): (t, o, c, l, h, v) for ticker, t, o, c, l, h, v in frame["candles"]
+        }
+        if frame["snapshot"]:
+            cls._rows, cls._candles = rows, {}
+        else:
+            cls._rows.update(rows)
+            for ticker in rows:
+                cls._candles.pop(ticker, None)
+        cls._updated_at = time.monotonic()
+
+
+REPLICA_AGE.set_function(CandlesFeedReplica.age)
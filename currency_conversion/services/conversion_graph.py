@@ -0,0 +1,105 @@
+import asyncio
+import traceback
+from collections.abc import Sequence
+from decimal import Decimal
+from itertools import permutations
+from typing import ClassVar, NamedTuple
+
+from loguru import logger
+
+from currency_conversion.services.quote_consumer import InMemoryQuoteService
+from schemas.types import Market, Ticker
+
+type Route = tuple["Leg", ...]
+
+
+class Leg(NamedTuple):
+    ticker: Ticker
+    inverse: bool  # Conversion is from quote to base asset of the ticker, rate is 1 / price
+
+    def rate(self, price: Decimal) -> Decimal:
+        return 1 / price if self.inverse else price
+
+
+class ConversionGraph:
+    """
+    Conversion routes between assets through the markets: direct one, then through a single hub asset,
+    then through two hub assets. Legs to the neighbour assets are precomputed when graph is built,
+    so finding a route is bounded by the number of hubs. Found routes of the known assets are kept in the route table.
+    """
+
+    HUBS: ClassVar[tuple[str, ...]] = ("USDT", "BTC", "ETH")  # In order of preference
+
+    def __init__(self, markets: Sequence[Market]) -> None:
+        self._legs: dict[tuple[str, str], Leg] = {}
+        for market in markets:
+            self._legs.setdefault((market.base, market.quote), Leg(market.T, inverse=False))
+        for market in markets:
+            self._legs.setdefault((market.quote, market.base), Leg(market.T, inverse=True))
+        self._assets = {asset for asset, _ in self._legs}
+        self._routes: dict[tuple[str, str], Route | None] = {}
+
+    def __len__(self) -> int:
+        return len(self._legs)
+
+    def route(self, from_: str, to: str) -> Route | None:
+        """Legs of the shortest conversion route, None if assets are not connected through the hubs"""
+        try:
+            return self._routes[from_, to]
+        except KeyError:
+            # Table is bounded by the markets, pairs of arbitrary requested assets are not kept
+            if from_ not in self._assets or to not in self._assets:
+                return None
+            self._routes[from_, to] = route = self._find_route(from_, to)
+            return route
+
+    def _find_route(self, from_: str, to: str) -> Route | None:
+        legs = self._legs
+        if from_ == to:
+            return ()
+        if (leg := legs.get((from_, to))) is not None:
+            return (leg,)
+        for hub in self.HUBS:
+            if (first := legs.get((from_, hub))) is not None and (last := legs.get((hub, to))) is not None:
+                return first, last
+        for hub_from, hub_to in permutations(self.HUBS, 2):
+            if (
+                (first := legs.get((from_, hub_from))) is not None
+                and (middle := legs.get((hub_from, hub_to))) is not None
+                and (last := legs.get((hub_to, to))) is not None
+            ):
+                return first, middle, last
+        return None
+
+
+class ConversionGraphService:
+    """Conversion graph of the markets known by quote consumer, rebuilt as the markets change"""
+
+    _graph: ClassVar[ConversionGraph] = ConversionGraph([])
+    _markets: ClassVar[list[Market]] = []
+
+    @classmethod
+    def route(cls, from_: str, to: str) -> Route | None:
+        """Conversion route. Until markets are loaded only the direct market is tried."""
+        if not cls._markets:
+            return (Leg(Ticker.build(f"{from_}{to}", "BINANCE"), inverse=False),)
+        return cls._graph.route(from_, to)
+
+    @classmethod
+    async def refresh(cls) -> None:
+        markets = await InMemoryQuoteService.get_markets()
+        if markets == cls._markets:
+            return
+        # Graph is replaced at once, requests never see partially built one
+        cls._graph, cls._markets = ConversionGraph(markets), markets
+        logger.info(f"Conversion graph rebuilt. Markets: {len(markets)}")
+
+    @classmethod
+    async def periodic_refresh(cls, period: float) -> None:
+        while True:
+            try:
+                await cls.refresh()
+            except Exception:
+                logger.error("Cannot refresh conversion graph.")
+                logger.error(traceback.format_exc())
+            await asyncio.sleep(period)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Sequence
+
+from schemas.types import Candle, Ticker, Timestamp
+
+type CandleKey = tuple[Ticker, Timestamp | None]  # Timestamp in seconds, None for the latest candle
+type CandlesFetcher = Callable[[list[CandleKey]], Awaitable[list[Candle | None]]]
+
+
+class QuoteCache:
+    """
+    Per process LRU cache of candles with bounded size.
+    Latest candles and candles of recent timestamps, which can still change, expire after short TTL.
+    Candles of older timestamps are final and expire after longer TTL, candles written late into DB,
+    e.g. retried after its outage, are seen after it. Misses are never final, they expire after the short TTL.
+    Concurrent misses of the same key are coalesced into single in-flight fetch, which completes even if
+    the request that started it is cancelled.
+    """
+
+    def __init__(self, max_size: int, latest_ttl: float, final_after: int, final_ttl: float) -> None:
+        self._max_size = max_size
+        self._latest_ttl = latest_ttl
+        self._final_after = final_after
+        self._final_ttl = final_ttl
+        self._entries: OrderedDict[CandleKey, tuple[float, Candle | None]] = OrderedDict()
+        self._in_flight: dict[CandleKey, asyncio.Future[Candle | None]] = {}
+        self._fetches: set[asyncio.Task[None]] = set()  # Detached fetches are referenced until done
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            "quote_cache_size": len(self._entries),
+            "quote_cache_hits": self.hits,
+            "quote_cache_misses": self.misses,
+            "quote_cache_coalesced": self.coalesced,
+        }
+
+    async def get_many(self, keys: Sequence[CandleKey], fetch: CandlesFetcher) -> list[Candle | None]:
+        """Candles of the keys in their order, missing ones are fetched with single call"""
+        now = time.monotonic()
+        candles: list[Candle | None] = [None] * len(keys)
+        waiting: list[tuple[int, asyncio.Future[Candle | None]]] = []
+        to_fetch: dict[CandleKey, list[int]] = {}
+        for idx, key in enumerate(keys):
+            if (entry := self._entries.get(key)) is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                candles[idx] = entry[1]
+                self.hits += 1
+            elif (in_flight := self._in_flight.get(key)) is not None:
+                waiting.append((idx, in_flight))
+                self.coalesced += 1
+            else:
+                if key not in to_fetch:
+                    to_fetch[key] = []
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+                to_fetch[key].append(idx)
+
+        if to_fetch:
+            await self._fetch(to_fetch, candles, fetch)
+        for idx, in_flight in waiting:
+            candles[idx] = await in_flight
+        return candles
+
+    async def _fetch(
+        self, to_fetch: dict[CandleKey, list[int]], candles: list[Candle | None], fetch: CandlesFetcher
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        futures = {key: loop.create_future() for key in to_fetch}
+        self._in_flight.update(futures)
+        # Fetch is detached from the request which started it: if that request is cancelled,
+        # e.g. its client disconnected, the coalesced waiters of the same keys still get the candles
+        task = asyncio.create_task(self._fetch_detached(futures, fetch))
+        self._fetches.add(task)
+        task.add_done_callback(self._fetch_done)
+        await asyncio.shield(task)
+        for key, indexes in to_fetch.items():
+            candle = futures[key].result()
+            for idx in indexes:
+                candles[idx] = candle
+
+    async def _fetch_detached(
+        self, futures: dict[CandleKey, asyncio.Future[Candle | None]], fetch: CandlesFetcher
+    ) -> None:
+        try:
+            fetched = await fetch(list(futures))
+        except asyncio.CancelledError:
+            for future in futures.values():
+                future.cancel()
+            raise
+        except Exception as ex:
+            for future in futures.values():
+                future.set_exception(ex)
+                future.exception()  # Waiters get the error themselves, nothing to report if there are none
+            raise
+        finally:
+            for key in futures:
+                self._in_flight.pop(key, None)
+
+        now, wall_now = time.monotonic(), time.time()
+        for (key, future), candle in zip(futures.items(), fetched, strict=True):
+            future.set_result(candle)
+            self._put(key, candle, now, wall_now)
+
+    def _fetch_done(self, task: asyncio.Task[None]) -> None:
+        self._fetches.discard(task)
+        if not task.cancelled():
+            task.exception()  # Error is raised to the request which started the fetch, if it is still waiting
+
+    def _put(self, key: CandleKey, candle: Candle | None, now: float, wall_now: float) -> None:
+        timestamp = key[1]
+        final = candle is not None and timestamp is not None and timestamp < wall_now - self._final_after
+        self._entries[key] = (now + (self._final_ttl if final else self._latest_ttl), candle)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
@@ -1,10 +1,14 @@
+import asyncio
+from collections.abc import Sequence
+from itertools import batched
 from typing import Any, ClassVar
 
 from aiosonic.client import HTTPClient
 from loguru import logger
 
+from common.candles_table import CandlesTableReader, CandlesTableUnavailableError
 from currency_conversion.core.settings import settings
-from schemas.types import Candle, Ticker, Timestamp
+from schemas.types import CANDLES_BATCH_MAX_SIZE, Candle, Market, Ticker, Timestamp
 
 
 class InMemoryQuoteServiceError(Exception):
@@ -13,12 +17,18 @@ class InMemoryQuoteServiceError(Exception):
 
 class InMemoryQuoteService:
     _http_client: ClassVar[HTTPClient] = HTTPClient()
+    _candles_table: ClassVar[CandlesTableReader | None] = (
+        CandlesTableReader(settings.CANDLES_TABLE_DIR) if settings.CANDLES_TABLE_DIR else None
+    )
 
     @classmethod
     async def get_in_memory_candle(
         cls, ticker: Ticker, timestamp: Timestamp | None = None
     ) -> Candle:
         """Get ticker price. If timestamp is None latest price is returned"""
+        if timestamp is None and (candle := cls._get_shared_memory_candle(ticker)) is not None:
+            return candle
+
         params: dict[str, Any] = {"ticker": ticker}
         if timestamp:
             params |= {"timestamp": timestamp}
@@ -32,3 +42,68 @@ class InMemoryQuoteService:
             raise InMemoryQuoteServiceError
 
         return Candle.model_validate(await resp.json())
+
+    @classmethod
+    async def get_in_memory_candles(cls, lookups: Sequence[tuple[Ticker, Timestamp | None]]) -> list[Candle | None]:
+        """
+        Candles of many tickers, in the order of lookups. Requests to quote consumer are split by its batch limit
+        and sent concurrently. None for the candle quote consumer has not in memory.
+        """
+        candles: list[Candle | None] = [None] * len(lookups)
+        remote_indexes: list[int] = []
+        for idx, (ticker, timestamp) in enumerate(lookups):
+            if timestamp is None and (candle := cls._get_shared_memory_candle(ticker)) is not None:
+                candles[idx] = candle
+            else:
+                remote_indexes.append(idx)
+        if not remote_indexes:
+            return candles
+
+        chunks = list(batched(remote_indexes, CANDLES_BATCH_MAX_SIZE))
+        responses = await asyncio.gather(*(cls._get_remote_candles([lookups[idx] for idx in chunk]) for chunk in chunks))
+        for chunk, items in zip(chunks, responses, strict=True):
+            for idx, item in zip(chunk, items, strict=True):
+                if item["candle"] is not None:
+                    candles[idx] = Candle.model_validate(item["candle"])
+        return candles
+
+    @classmethod
+    async def _get_remote_candles(cls, lookups: Sequence[tuple[Ticker, Timestamp | None]]) -> list[dict[str, Any]]:
+        body = [{"ticker": ticker, "timestamp": timestamp} for ticker, timestamp in lookups]
+        try:
+            resp = await cls._http_client.post(f"{settings.QUOTE_CONSUMER_SERVICE}candles/batch", json=body)
+        except Exception as ex:
+            logger.error(f"Service {cls.__name__} not working.")
+            raise InMemoryQuoteServiceError from ex
+
+        if not resp.ok:
+            raise InMemoryQuoteServiceError
+
+        return await resp.json()
+
+    @classmethod
+    async def get_markets(cls) -> list[Market]:
+        try:
+            resp = await cls._http_client.get(f"{settings.QUOTE_CONSUMER_SERVICE}markets")
+        except Exception as ex:
+            logger.error(f"Service {cls.__name__} not working.")
+            raise InMemoryQuoteServiceError from ex
+
+        if not resp.ok:
+            raise InMemoryQuoteServiceError
+
+        return [Market.model_validate(market) for market in await resp.json()]
+
+    @classmethod
+    def _get_shared_memory_candle(cls, ticker: Ticker) -> Candle | None:
+        """Latest candle from the table shared with quote consumer on the same host, without HTTP round trip"""
+        if cls._candles_table is None:
+            return None
+        try:
+            row = cls._candles_table.get(ticker)
+        except CandlesTableUnavailableError:
+            return None
+        if row is None:
+            return None
+        t, o, c, l, h, v = row
+        return Candle.from_floats(ticker, t, o=o, c=c, l=l, h=h, v=v)
@@ -0,0 +1,88 @@
+from collections.abc import Sequence
+from typing import ClassVar
+
+from common.metrics import Counter, Gauge
+from currency_conversion.core.settings import settings
+from currency_conversion.services.candles_feed import CandlesFeedReplica
+from currency_conversion.services.quote_cache import CandleKey, QuoteCache
+from currency_conversion.services.quote_consumer import InMemoryQuoteService, InMemoryQuoteServiceError
+from db.repositories import DB
+from schemas.types import Candle
+
+QUOTE_CANDLES = Counter("quote_candles", "Candles looked up for quotes by the source answering them", ["source"])
+QUOTE_CONSUMER_FAILURES = Counter("quote_consumer_failures", "Lookups falling back to DB as quote consumer failed")
+QUOTE_CACHE_LOOKUPS = Counter("quote_cache_lookups", "Lookups of the quote cache by result", ["result"])
+QUOTE_CACHE_SIZE = Gauge("quote_cache_candles", "Candles in the quote cache")
+_REPLICA_CANDLES = QUOTE_CANDLES.labels("replica")
+_QUOTE_CONSUMER_CANDLES = QUOTE_CANDLES.labels("quote_consumer")
+_DB_CANDLES = QUOTE_CANDLES.labels("db")
+_NOT_FOUND_CANDLES = QUOTE_CANDLES.labels("not_found")
+
+
+class QuoteService:
+    """
+    Candles for conversions. Latest candles come from the local feed replica while it is fresh,
+    the rest from quote consumer memory first, then DB, both behind the per process cache.
+    """
+
+    _cache: ClassVar[QuoteCache] = QuoteCache(
+        settings.QUOTE_CACHE_SIZE,
+        settings.QUOTE_CACHE_LATEST_TTL,
+        settings.QUOTE_CACHE_FINAL_AFTER,
+        settings.QUOTE_CACHE_FINAL_TTL,
+    )
+
+    @classmethod
+    async def get_candles(cls, lookups: Sequence[CandleKey]) -> list[Candle | None]:
+        """Candles of (ticker, timestamp) lookups in their order, None if there is no candle"""
+        candles: list[Candle | None] = [None] * len(lookups)
+        remaining: list[int] = []
+        for idx, (ticker, timestamp) in enumerate(lookups):
+            if timestamp is None and (candle := CandlesFeedReplica.get(ticker)) is not None:
+                candles[idx] = candle
+            else:
+                remaining.append(idx)
+        _REPLICA_CANDLES.inc(len(lookups) - len(remaining))
+        if not remaining:
+            return candles
+
+        cached = await cls._cache.get_many([lookups[idx] for idx in remaining], cls._fetch)
+        for idx, candle in zip(remaining, cached, strict=True):
+            candles[idx] = candle
+        return candles
+
+    @classmethod
+    def cache_lookups(cls) -> list[tuple[tuple[str], int]]:
+        return [(("hit",), cls._cache.hits), (("miss",), cls._cache.misses), (("coalesced",), cls._cache.coalesced)]
+
+    @classmethod
+    def cache_size(cls) -> list[tuple[tuple[()], int]]:
+        return [((), len(cls._cache))]
+
+    @classmethod
+    def get_stats(cls) -> dict[str, int]:
+        return cls._cache.get_stats() | CandlesFeedReplica.get_stats()
+
+    @staticmethod
+    async def _fetch(lookups: list[CandleKey]) -> list[Candle | None]:
+        """Candles from quote consumer memory with single request, the missing ones with single DB query"""
+        try:
+            candles = await InMemoryQuoteService.get_in_memory_candles(lookups)
+        except InMemoryQuoteServiceError:
+            QUOTE_CONSUMER_FAILURES.inc()
+            candles = [None] * len(lookups)
+
+        missing = [idx for idx, candle in enumerate(candles) if candle is None]
+        _QUOTE_CONSUMER_CANDLES.inc(len(lookups) - len(missing))
+        if missing:
+            db_candles = await DB.candles_1s.get_latest_candles([lookups[idx] for idx in missing])
+            for idx, candle in zip(missing, db_candles, strict=True):
+                candles[idx] = candle
+            not_found = sum(candle is None for candle in db_candles)
+            _DB_CANDLES.inc(len(missing) - not_found)
+            _NOT_FOUND_CANDLES.inc(not_found)
+        return candles
+
+
+QUOTE_CACHE_LOOKUPS.set_function(QuoteService.cache_lookups)
+QUOTE_CACHE_SIZE.set_function(QuoteService.cache_size)
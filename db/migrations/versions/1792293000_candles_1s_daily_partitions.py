@@ -0,0 +1,128 @@
+"""
+Candles 1s daily partitions
+
+Revision ID: aa78e71acf82
+Revises: baa5e36e9d93
+Create Date: 2026-10-18 03:10:00.000000
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "aa78e71acf82"
+down_revision: str | Sequence[str] | None = "baa5e36e9d93"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+CREATE_PARTITIONS_FUNCTION = """
+CREATE FUNCTION candles_1s_create_partitions(from_day date, to_day date) RETURNS integer AS $$
+DECLARE
+    day date;
+    created integer := 0;
+BEGIN
+    FOR day IN SELECT generate_series(from_day, to_day, interval '1 day')::date LOOP
+        IF to_regclass('candles_1s_' || to_char(day, 'YYYYMMDD')) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF candles_1s FOR VALUES FROM (%L) TO (%L)',
+                'candles_1s_' || to_char(day, 'YYYYMMDD'),
+                day::timestamp AT TIME ZONE 'UTC',
+                (day + 1)::timestamp AT TIME ZONE 'UTC'
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+# Partition is dropped once its whole day is older than `till`
+DROP_PARTITIONS_FUNCTION = """
+CREATE FUNCTION candles_1s_drop_partitions(till timestamptz) RETURNS integer AS $$
+DECLARE
+    partition_name text;
+    dropped integer := 0;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'candles_1s'::regclass AND c.relname ~ '^candles_1s_\\d{8}$'
+    LOOP
+        IF (to_date(right(partition_name, 8), 'YYYYMMDD') + 1)::timestamp AT TIME ZONE 'UTC' <= till THEN
+            EXECUTE format('DROP TABLE %I', partition_name);
+            dropped := dropped + 1;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+def _candle_columns() -> list[sa.Column]:
+    return [
+        sa.Column("ticker", sa.String(100), nullable=False),
+        sa.Column("t", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("open", sa.Numeric(38, 18), nullable=False),
+        sa.Column("close", sa.Numeric(38, 18), nullable=False),
+        sa.Column("high", sa.Numeric(38, 18), nullable=False),
+        sa.Column("low", sa.Numeric(38, 18), nullable=False),
+        sa.Column("volume", sa.Numeric(38, 18)),
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.rename_table("candles_1s", "candles_1s_unpartitioned")
+    op.drop_index("idx__candles_1s__ticker__t", table_name="candles_1s_unpartitioned")
+    op.drop_index("idx__candles_1s__t", table_name="candles_1s_unpartitioned")
+
+    op.create_table(
+        "candles_1s",
+        *_candle_columns(),
+        sa.PrimaryKeyConstraint("ticker", "t", name="pk__candles_1s"),
+        postgresql_partition_by="RANGE (t)",
+    )
+    op.create_index("idx__candles_1s__t", "candles_1s", ["t"])
+    op.execute(CREATE_PARTITIONS_FUNCTION)
+    op.execute(DROP_PARTITIONS_FUNCTION)
+
+    # Partitions of upcoming days are then maintained by quote consumer
+    op.execute(
+        """
+        SELECT candles_1s_create_partitions(
+            coalesce((SELECT min(t) AT TIME ZONE 'UTC' FROM candles_1s_unpartitioned)::date, current_date),
+            (now() AT TIME ZONE 'UTC')::date + 3
+        )
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO candles_1s (ticker, t, open, close, high, low, volume)
+        SELECT ticker, t, open, close, high, low, volume FROM candles_1s_unpartitioned
+        """
+    )
+    op.drop_table("candles_1s_unpartitioned")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table(
+        "candles_1s_unpartitioned",
+        sa.Column("id", sa.BigInteger, primary_key=True),
+        *_candle_columns(),
+    )
+    op.execute(
+        """
+        INSERT INTO candles_1s_unpartitioned (ticker, t, open, close, high, low, volume)
+        SELECT ticker, t, open, close, high, low, volume FROM candles_1s
+        """
+    )
+    op.drop_table("candles_1s")
+    op.execute("DROP FUNCTION candles_1s_create_partitions(date, date)")
+    op.execute("DROP FUNCTION candles_1s_drop_partitions(timestamptz)")
+    op.rename_table("candles_1s_unpartitioned", "candles_1s")
+    op.create_index("idx__candles_1s__ticker__t", "candles_1s", ["ticker", "t"], unique=True)
+    op.create_index("idx__candles_1s__t", "candles_1s",["t"])
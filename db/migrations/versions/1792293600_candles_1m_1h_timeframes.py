@@ -0,0 +1,44 @@
+"""
+Candles 1m and 1h timeframes
+
+Revision ID: 3c1f7d2e9b84
+Revises: aa78e71acf82
+Create Date: 2026-10-18 03:20:00.000000
+
+"""
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3c1f7d2e9b84"
+down_revision: str | Sequence[str] | None = "aa78e71acf82"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+TABLES = ("candles_1m", "candles_1h")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        op.create_table(
+            table,
+            sa.Column("ticker", sa.String(100), nullable=False),
+            sa.Column("t", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("open", sa.Numeric(38, 18), nullable=False),
+            sa.Column("close", sa.Numeric(38, 18), nullable=False),
+            sa.Column("high", sa.Numeric(38, 18), nullable=False),
+            sa.Column("low", sa.Numeric(38, 18), nullable=False),
+            sa.Column("volume", sa.Numeric(38, 18)),
+            sa.PrimaryKeyConstraint("ticker", "t", name=f"pk__{table}"),
+        )
+        op.create_index(f"idx__{table}__t", table, ["t"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.drop_index(f"idx__{table}__t", table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,87 @@
+-- name: bulk_upsert_candles_1m*!
+INSERT INTO candles_1m (ticker, t, open, close, high, low, volume)
+VALUES (:ticker, :t, :open, :close, :high, :low, :volume)
+ON CONFLICT (ticker, t)
+DO UPDATE SET
+    open = EXCLUDED.open,
+    close = EXCLUDED.close,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    volume = EXCLUDED.volume;
+
+
+-- name: create_candles_1m_staging#
+-- Session scoped and not WAL logged staging table for COPY based bulk upsert
+CREATE TEMP TABLE IF NOT EXISTS candles_1m_staging (
+    ticker text,
+    t bigint,
+    open double precision,
+    close double precision,
+    high double precision,
+    low double precision,
+    volume double precision
+) ON COMMIT DELETE ROWS;
+
+
+-- name: merge_candles_1m_staging!
+INSERT INTO candles_1m (ticker, t, open, close, high, low, volume)
+SELECT ticker, to_timestamp(t), open, close, high, low, volume FROM candles_1m_staging
+ON CONFLICT (ticker, t)
+DO UPDATE SET
+    open = EXCLUDED.open,
+    close = EXCLUDED.close,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    volume = EXCLUDED.volume;
+
+
+-- name: remove_old_candles_1m$
+-- Returns number of removed candles
+WITH removed AS (DELETE FROM candles_1m WHERE t < :till RETURNING 1)
+SELECT count(*) FROM removed
+
+
+-- name: get_candles_1m_in_range
+SELECT * FROM candles_1m WHERE t >= :from_ AND t <= :to;
+
+
+-- name: get_candles_1m_rows_since
+-- Plain columns for warm start of the in memory buffer, grouped by ticker
+SELECT
+    ticker,
+    extract(epoch FROM t)::bigint AS t,
+    open::float8,
+    close::float8,
+    high::float8,
+    low::float8,
+    coalesce(volume, 0)::float8 AS volume
+FROM candles_1m
+WHERE t >= :from_
+ORDER BY ticker, t;
+
+
+-- name: get_candles_1m_rows_in_range
+-- Plain columns of the tickers in [from_, till) for bulk export, grouped by ticker
+SELECT
+    ticker,
+    extract(epoch FROM t)::bigint AS t,
+    open::float8,
+    close::float8,
+    high::float8,
+    low::float8,
+    coalesce(volume, 0)::float8 AS volume
+FROM candles_1m
+WHERE ticker = ANY(CAST(:tickers AS text[])) AND t >= :from_ AND t < :till
+ORDER BY ticker, t;
+
+-- name: get_latest_candles_1m^
+SELECT * FROM candles_1m WHERE ticker = :ticker AND t <= :till_dt ORDER BY t DESC LIMIT 1
+
+
+-- name: get_latest_candles_1m_batch
+-- Latest candle at or before till_dt for every (ticker, till_dt) pair, idx is 1 based position of the pair
+SELECT lookup.idx, candle.*
+FROM unnest(CAST(:tickers AS text[]), CAST(:till_dts AS timestamptz[])) WITH ORDINALITY AS lookup(ticker, till_dt, idx)
+CROSS JOIN LATERAL (
+    SELECT * FROM candles_1m WHERE ticker = lookup.ticker AND t <= lookup.till_dt ORDER BY t DESC LIMIT 1
+) AS candle;
@@ -1,6 +1,19 @@
+from common.metrics import Gauge
 from db.repositories.base import DBManager
+from db.repositories.candles.repo import CandlesRepo
 from db.repositories.candles_1s.repo import Candles1sRepo
+from schemas.types import Timeframe
 
 
 class DB(DBManager):
     candles_1s = Candles1sRepo("candles_1s")
+    candles_1m = CandlesRepo("candles_1m")
+    candles_1h = CandlesRepo("candles_1h")
+
+    @classmethod
+    def candles(cls, timeframe: Timeframe) -> CandlesRepo:
+        return getattr(cls, f"candles_{timeframe}")
+
+
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Connections of DB pools by lane and state", ["lane", "state"])
+DB_POOL_CONNECTIONS.set_function(DB.pool_usage)
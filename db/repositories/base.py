@@ -1,20 +1,56 @@
 import inspect
+from collections.abc import Iterator, Mapping
+from enum import StrEnum
+from functools import partial
 from typing import TYPE_CHECKING, Any, ClassVar, TypeIs
 
 import asyncpg
+from asyncpg.connection import LoggedQuery
 from loguru import logger
+from pydantic import BaseModel
+
+from common.metrics import Histogram
+from db.queries.queries import queries
+
+# Latency of the queries run through the pools, by aiosql query name
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "Latency of DB queries by aiosql query name", ["query"])
+# Processed SQL of aiosql queries to their names, cursor variants share the SQL of the plain query
+_QUERY_NAMES = {
+    getattr(queries, name).sql: name for name in queries.available_queries if not name.endswith("_cursor")
+}
+
+
+class DBLane(StrEnum):
+    """Separate pools, so slow background queries cannot starve latency sensitive lookups"""
+
+    DEFAULT = "default"  # Lookups
+    WRITE = "write"  # Candles flushes
+    MAINTENANCE = "maintenance"  # Retention, partitions and warm start
+    EXPORT = "export"  # Range exports, streamed to API clients at their pace
+
+
+class PoolConfigs(BaseModel):
+    min_size: int = 2
+    max_size: int = 10
+    statement_timeout: float | None = None  # Seconds, queries running longer are cancelled by Postgres
+    idle_timeout: float | None = None  # Seconds, sessions idle in transaction longer are terminated by Postgres
 
 
 class BaseRepo:
     if TYPE_CHECKING:
         pool: asyncpg.Pool
+        pools: dict[DBLane, asyncpg.Pool]
 
     def __init__(self, table_name: str) -> None:
         self.table_name = table_name
 
+    async def prepare(self, conn: asyncpg.Connection) -> None:
+        """Prepare hot lookups on new connection of the default lane"""
+
 
 class DBManager:
     pool: ClassVar[asyncpg.Pool]
+    pools: ClassVar[dict[DBLane, asyncpg.Pool]]
     _repos: ClassVar[dict[str, BaseRepo]] = {}
 
     def __init_subclass__(cls) -> None:
@@ -26,17 +62,27 @@ class DBManager:
 
 
     @classmethod
-    async def connect(cls, dsn: str) -> None:
+    async def connect(cls, dsn: str, pools: Mapping[DBLane, PoolConfigs] | None = None) -> None:
+        """Pool per configured lane, lanes without configs share the default one"""
         if cls == DBManager:
             raise RuntimeError("Cannot connect from this level.")
 
         if getattr(cls, "pool", None) is not None:
             raise RuntimeError("Already connected!")
 
-        cls.pool = await asyncpg.create_pool(dsn=dsn)
+        pools = pools or {}
+        cls.pool = await cls._create_pool(dsn, DBLane.DEFAULT, pools.get(DBLane.DEFAULT, PoolConfigs()))
+        cls.pools = {DBLane.DEFAULT: cls.pool}
+        for lane in DBLane:
+            if lane is DBLane.DEFAULT:
+                continue
+            cls.pools[lane] = cls.pool if (configs := pools.get(lane)) is None else await cls._create_pool(
+                dsn, lane, configs
+            )
         for name, repo in cls._repos.items():
             logger.info(f"Repo {name} ready.")
             repo.pool = cls.pool
+            repo.pools = cls.pools
 
     @classmethod
     async def disconnect(cls) -> None:
@@ -45,4 +91,53 @@ class DBManager:
 
         if cls.pool is None:
             raise RuntimeError("Connect first!")
-        await cls.pool.close()
+        for pool in set(cls.pools.values()):
+            await pool.close()
+
+    @classmethod
+    def pool_usage(cls) -> Iterator[tuple[tuple[str, str], int]]:
+        """Connections of the lanes: (lane, in_use | idle | max), lanes sharing the default pool are skipped"""
+        for lane, pool in getattr(cls, "pools", {}).items():
+            if lane is not DBLane.DEFAULT and pool is cls.pool:
+                continue
+            idle = pool.get_idle_size()
+            yield (lane, "in_use"), pool.get_size() - idle
+            yield (lane, "idle"), idle
+            yield (lane, "max"), pool.get_max_size()
+
+    @classmethod
+    def get_stats(cls) -> dict[str, int]:
+        stats: dict[str, int] = {}
+        for (lane, state), value in cls.pool_usage():
+            stats[f"db_pool_{lane}_{state}"] = value
+        for (name,), series in QUERY_LATENCY.series():
+            stats[f"db_query_{name}_count"] = series.count
+            stats[f"db_query_{name}_ms"] = int(series.sum * 1000)
+        return stats
+
+    @classmethod
+    async def _create_pool(cls, dsn: str, lane: DBLane, configs: PoolConfigs) -> asyncpg.Pool:
+        server_settings = {"application_name": f"crypto_converter_{lane}"}
+        if configs.statement_timeout is not None:
+            server_settings["statement_timeout"] = str(int(configs.statement_timeout * 1000))
+        if configs.idle_timeout is not None:
+            server_settings["idle_in_transaction_session_timeout"] = str(int(configs.idle_timeout * 1000))
+        return await asyncpg.create_pool(
+            dsn=dsn,
+            min_size=configs.min_size,
+            max_size=configs.max_size,
+            server_settings=server_settings,
+            max_cached_statement_lifetime=0,  # Prepared statements are kept for the lifetime of the connection
+            init=partial(cls._init_connection, lane),
+        )
+
+    @classmethod
+    async def _init_connection(cls, lane: DBLane, conn: asyncpg.Connection) -> None:
+        conn.add_query_logger(_observe_query)
+        if lane is DBLane.DEFAULT:
+            for repo in cls._repos.values():
+                await repo.prepare(conn)
+
+
+def _observe_query(query: LoggedQuery) -> None:
+    QUERY_LATENCY.labels(_QUERY_NAMES.get(query.query, "other")).observe(query.elapsed)
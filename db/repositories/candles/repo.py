@@ -0,0 +1,126 @@
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Sequence
+from datetime import UTC, datetime
+from typing import Any
+
+import asyncpg
+
+from db.queries.queries import queries
+from db.repositories.base import BaseRepo, DBLane
+from db.repositories.candles_1s.schema import CandleDB, CandleRecord
+from schemas.types import Candle, Ticker, Timestamp
+
+_STAGING_COLUMNS = ("ticker", "t", "open", "close", "high", "low", "volume")
+
+
+class CandlesRepo(BaseRepo):
+    """Candles of a single timeframe table. Queries of the table are in `db/queries/sql/<table name>.sql`"""
+
+    async def prepare(self, conn: asyncpg.Connection) -> None:
+        """Latest candle lookups answer API fallbacks, they are run once with no matches to prepare them"""
+        await self._query("get_latest_{table}")(conn, ticker="", till_dt=datetime.now(UTC))
+        await self._query("get_latest_{table}_batch")(conn, tickers=[], till_dts=[])
+
+    async def bulk_upsert(self, candles: Iterable[Candle]) -> None:
+        if not (db_candles := [_candle_to_db(cndl) for cndl in candles]):
+            return
+        await self._query("bulk_upsert_{table}")(self.pools[DBLane.WRITE], db_candles)
+
+    async def bulk_upsert_copy(self, records: Iterable[CandleRecord]) -> None:
+        """Stream candles by binary COPY into the staging table and merge them with single upsert"""
+        if not (records := list(records)):
+            return
+        async with self.pools[DBLane.WRITE].acquire() as conn, conn.transaction():
+            await self._query("create_{table}_staging")(conn)
+            await conn.copy_records_to_table(f"{self.table_name}_staging", records=records, columns=_STAGING_COLUMNS)
+            await self._query("merge_{table}_staging")(conn)
+
+    async def remove_old_candles(self, to: datetime) -> int:
+        """Returns number of removed candles"""
+        return await self._query("remove_old_{table}")(self.pools[DBLane.MAINTENANCE], till=to)
+
+    async def get_latest_candle(self, ticker: Ticker, *, timestamp: Timestamp | None = None) -> Candle | None:
+        if timestamp is None:
+            timestamp = Timestamp.now()
+        if not (rec := await self._query("get_latest_{table}")(self.pool, ticker=ticker, till_dt=timestamp.to_dt())):
+            return None
+        return _db_candle_to_candle(rec)
+
+    async def get_latest_candles(
+        self, lookups: Sequence[tuple[Ticker, Timestamp | None]]
+    ) -> list[Candle | None]:
+        """Latest candles of many (ticker, timestamp) pairs with single query, in the order of lookups"""
+        if not lookups:
+            return []
+        now = Timestamp.now()
+        tickers = [ticker for ticker, _ in lookups]
+        till_dts = [(now if timestamp is None else timestamp).to_dt() for _, timestamp in lookups]
+        candles: list[Candle | None] = [None] * len(lookups)
+        for rec in await self._query("get_latest_{table}_batch")(self.pool, tickers=tickers, till_dts=till_dts):
+            candles[rec["idx"] - 1] = _db_candle_to_candle(rec)
+        return candles
+
+    async def iter_candle_records(self, from_: datetime, batch_size: int = 10_000) -> AsyncIterator[list[CandleRecord]]:
+        """
+        Candles since `from_` as plain records ordered by ticker and time, fetched by large batches.
+        Bypasses models, ticker of the record is a plain str.
+        """
+        async for batch in self._iter_records(
+            "get_{table}_rows_since", from_, lane=DBLane.MAINTENANCE, batch_size=batch_size
+        ):
+            yield batch
+
+    async def iter_candle_records_in_range(
+        self, tickers: Sequence[Ticker], from_: datetime, till: datetime, batch_size: int = 10_000
+    ) -> AsyncIterator[list[CandleRecord]]:
+        """
+        Candles of the tickers in [from_, till) as plain records ordered by ticker and time, by large batches.
+        Consumer may be slow, so the cursor is held on the export lane, not the maintenance one.
+        """
+        async for batch in self._iter_records(
+            "get_{table}_rows_in_range", list(tickers), from_, till, lane=DBLane.EXPORT, batch_size=batch_size
+        ):
+            yield batch
+
+    async def get_candles(self, from_: datetime, to: datetime | None = None) -> AsyncIterable[Candle]:
+        if to is None:
+            to = datetime.now(tz=UTC)
+        async with self._query("get_{table}_in_range_cursor")(
+            self.pools[DBLane.MAINTENANCE], from_=from_, to=to
+        ) as cursor:
+            async for row in cursor:
+                yield _db_candle_to_candle(row)
+
+    async def _iter_records(
+        self, name: str, *args: Any, lane: DBLane, batch_size: int
+    ) -> AsyncIterator[list[CandleRecord]]:
+        """Rows of the query through server side cursor, so memory is bounded by the batch size"""
+        async with self.pools[lane].acquire() as conn, conn.transaction():
+            cursor = await conn.cursor(self._query(name).sql, *args)  # type: ignore[attr-defined]
+            while batch := await cursor.fetch(batch_size):
+                yield batch
+
+    def _query(self, name: str) -> Callable[..., Any]:
+        return getattr(queries, name.format(table=self.table_name))
+
+
+def _candle_to_db(candle: Candle) -> CandleDB:
+    return CandleDB(
+        ticker=candle.T,
+        t=candle.t,
+        open=candle.o,
+        close=candle.c,
+        high=candle.h,
+        low=candle.l,
+        volume=candle.v,
+    )
+
+def _db_candle_to_candle(candle_db: CandleDB) -> Candle:
+    return Candle(
+        T=Ticker(candle_db["ticker"]),
+        t=candle_db["t"],
+        o=candle_db["open"],
+        c=candle_db["close"],
+        h=candle_db["high"],
+        l=candle_db["low"],
+        v=candle_db["volume"],
+    )
@@ -15,3 +15,7 @@ class CandleDB(TypedDict):
     high: Decimal
     low: Decimal
     volume: Decimal
+
+
+# Candle as streamed by COPY: ticker, t (unix seconds), open, close, high, low, volume
+type CandleRecord = tuple[Ticker, int, float, float, float, float, float]
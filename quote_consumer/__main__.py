@@ -1,6 +1,7 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 
+from common.metrics import CONTENT_TYPE, render
 from quote_consumer.api.api import router as api
 from quote_consumer.core.events import LifeSpan
 from quote_consumer.core.settings import settings
@@ -15,6 +16,16 @@ async def health_check() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/stats", tags=["system"], include_in_schema=False)
+async def ingestion_stats(request: Request) -> dict[str, int]:
+    return await request.app.state.candle_store.get_stats()
+
+
+@app.get("/metrics", tags=["system"], include_in_schema=False)
+async def metrics(request: Request) -> Response:
+    return Response(render(await request.app.state.candle_store.get_metrics()), media_type=CONTENT_TYPE)
+
+
 # TODO: Replace with the gRPC server
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=settings.APP_PORT)
@@ -3,7 +3,9 @@
 from fastapi import APIRouter
 
 from quote_consumer.api.candles import router as candles_router
+from quote_consumer.api.markets import router as markets_router
 
 router = APIRouter()
 
 router.include_router(candles_router, prefix="/candles")
+router.include_router(markets_router, prefix="/markets")
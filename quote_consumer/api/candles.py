@@ -1,39 +1,148 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from starlette.status import HTTP_404_NOT_FOUND
+from array import array
+from collections.abc import AsyncIterator, Iterable, Sequence
+from itertools import groupby
+from operator import itemgetter
 
-from quote_consumer.api.dependencies import get_in_memory_storage
-from quote_consumer.candle_processor import CandleBuffer
-from schemas.types import Candle, Ticker, Timestamp
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from starlette.status import (
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_503_SERVICE_UNAVAILABLE,
+    WS_1013_TRY_AGAIN_LATER,
+)
+
+from common.candle_columns import MEDIA_TYPE, CandleColumns, encode_chunk
+from db.repositories import DB
+from db.repositories.candles_1s.schema import CandleRecord
+from quote_consumer.api.dependencies import get_candle_store, get_candles_feed
+from quote_consumer.candle_store import (
+    CandleLookup,
+    CandleNotFoundError,
+    CandleRange,
+    CandleStore,
+    CandleStoreError,
+)
+from quote_consumer.candles_feed import CandlesFeed
+from schemas.types import CANDLES_BATCH_MAX_SIZE, Candle, Ticker, Timeframe, Timestamp
 
 router = APIRouter()
 
+MAX_BATCH_SIZE = CANDLES_BATCH_MAX_SIZE
+MAX_RANGE_TICKERS = 1_000
+RANGE_CHUNK_SIZE = 50_000  # Candles per chunk of the range stream and per DB cursor fetch
+
+
+class _CandleLookup(BaseModel):
+    ticker: Ticker
+    timestamp: Timestamp | None = None
+
+
+class _BatchCandle(BaseModel):
+    candle: Candle | None = None
+    error: str | None = None
+
 @router.get("")
 async def get_candle(
     ticker: Ticker = Query(...),
     timestamp: Timestamp | None = Query(None),
-    in_memory_storage: CandleBuffer = Depends(get_in_memory_storage)
+    timeframe: Timeframe = Query(Timeframe.S1),
+    candle_store: CandleStore = Depends(get_candle_store)
 ) -> Candle:
     """
     Get the latest candle value for the ticker from the memory if present.
     If timestamp is provided find the quote at exact that timestamp or the closest one.
+    Candles of higher timeframes are rolled up from the same trades, timestamp of the candle is the interval start.
     """
-    if (ticker_buffer := in_memory_storage.get(ticker)) is None:
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="ticker_not_in_memory")
+    try:
+        return await candle_store.get_candle(ticker, timestamp, timeframe)
+    except CandleNotFoundError as ex:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=str(ex)) from ex
+    except CandleStoreError as ex:
+        raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="candles_unavailable") from ex
 
-    if not (sorted_timestamps := sorted(ticker_buffer.keys())):
-        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="no_candles_for_ticker")
 
-    # If timestamp is not provided or timestamp is out of upper range return latest candle
-    if timestamp is None or timestamp > sorted_timestamps[-1]:
-        latest_timestamp = sorted_timestamps[-1]
-        return  ticker_buffer[latest_timestamp]
+@router.post("/batch")
+async def get_candles_batch(
+    lookups: list[_CandleLookup] = Body(..., max_length=MAX_BATCH_SIZE),
+    candle_store: CandleStore = Depends(get_candle_store)
+) -> list[_BatchCandle]:
+    """
+    Candles of many tickers in one request, looked up the same way as single candle.
+    Results are in the order of lookups, candle which cannot be found has the reason as error.
+    """
+    candles = await candle_store.get_candles([CandleLookup(lookup.ticker, lookup.timestamp) for lookup in lookups])
+    return [
+        _BatchCandle(candle=candle) if isinstance(candle, Candle) else _BatchCandle(error=_error_detail(candle))
+        for candle in candles
+    ]
 
-    if candle := ticker_buffer.get(timestamp):
-        return candle
 
-    # Return closest timestamp
-    for ts in reversed(sorted_timestamps):
-        if ts < timestamp:
-            return ticker_buffer[ts]
+def _error_detail(error: CandleStoreError) -> str:
+    return str(error) if isinstance(error, CandleNotFoundError) else "candles_unavailable"
 
-    raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="too_old_timestamp")
+
+@router.get("/range", response_class=StreamingResponse)
+async def get_candle_range(
+    tickers: list[Ticker] = Query(..., max_length=MAX_RANGE_TICKERS),
+    from_: Timestamp = Query(..., alias="from"),
+    to: Timestamp = Query(...),
+    timeframe: Timeframe = Query(Timeframe.S1),
+    candle_store: CandleStore = Depends(get_candle_store)
+) -> StreamingResponse:
+    """
+    Candles of the tickers between `from` and `to` inclusive as chunked columnar binary stream,
+    format is described in `common/candle_columns.py`. Chunks of a ticker come in time order.
+    The recent part of the range is served from memory, the older one from DB through server side cursor.
+    """
+    if from_ > to:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="invalid_range")
+    # DB part returns every ticker once, memory part would repeat the duplicated ones
+    tickers = list(dict.fromkeys(tickers))
+    till = to + 1
+    try:
+        memory_range = await candle_store.get_candle_range(tickers, from_, till, timeframe)
+    except CandleStoreError:
+        memory_range = CandleRange(None, [])
+    return StreamingResponse(_stream_candle_range(tickers, from_, till, timeframe, memory_range), media_type=MEDIA_TYPE)
+
+
+async def _stream_candle_range(
+    tickers: Sequence[Ticker], from_: int, till: int, timeframe: Timeframe, memory_range: CandleRange
+) -> AsyncIterator[bytes]:
+    db_till = till if memory_range.covered_from is None else min(till, memory_range.covered_from)
+    if from_ < db_till:
+        async for records in DB.candles(timeframe).iter_candle_records_in_range(
+            tickers, Timestamp(from_).to_dt(), Timestamp(db_till).to_dt(), RANGE_CHUNK_SIZE
+        ):
+            for ticker, columns in _records_to_columns(records):
+                yield encode_chunk(ticker, columns)
+    for ticker, columns in memory_range.columns:
+        for start in range(0, len(columns[0]), RANGE_CHUNK_SIZE):
+            yield encode_chunk(ticker, tuple(column[start:start + RANGE_CHUNK_SIZE] for column in columns))  # type: ignore[arg-type]
+
+
+def _records_to_columns(records: Iterable[CandleRecord]) -> Iterable[tuple[Ticker, CandleColumns]]:
+    """Records are ordered by ticker and time"""
+    for ticker, ticker_records in groupby(records, key=itemgetter(0)):
+        _, t, o, c, h, l, v = zip(*ticker_records, strict=True)
+        yield Ticker(ticker), (array("q", t), array("d", o), array("d", h), array("d", l), array("d", c), array("d", v))
+
+
+@router.websocket("/feed")
+async def candles_feed(websocket: WebSocket, feed: CandlesFeed = Depends(get_candles_feed)) -> None:
+    """
+    Stream of the latest 1s candles. First frame has the latest candles of all tickers,
+    then every second the candles changed since the previous frame.
+    """
+    await websocket.accept()
+    subscription = feed.subscribe()
+    try:
+        while (frame := await subscription.next_frame()) is not None:
+            await websocket.send_text(frame)
+        await websocket.close(code=WS_1013_TRY_AGAIN_LATER, reason="subscriber_too_slow")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        feed.unsubscribe(subscription)
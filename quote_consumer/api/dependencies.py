@@ -1,7 +1,12 @@
-from fastapi import Request
+from fastapi import Request, WebSocket
 
-from quote_consumer.candle_processor import CandleBuffer
+from quote_consumer.candle_store import CandleStore
+from quote_consumer.candles_feed import CandlesFeed
 
 
-def get_in_memory_storage(request: Request) -> CandleBuffer:
-    return request.app.state.in_memory_storage
+def get_candle_store(request: Request) -> CandleStore:
+    return request.app.state.candle_store
+
+
+def get_candles_feed(websocket: WebSocket) -> CandlesFeed:
+    return websocket.app.state.candles_feed
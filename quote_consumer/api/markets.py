@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from quote_consumer.api.dependencies import get_candle_store
+from quote_consumer.candle_store import CandleStore, CandleStoreError
+from schemas.types import Market
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_markets(candle_store: CandleStore = Depends(get_candle_store)) -> list[Market]:
+    """All markets of the exchanges, including the ones without trades yet"""
+    try:
+        return await candle_store.get_markets()
+    except CandleStoreError as ex:
+        raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="markets_unavailable") from ex
@@ -0,0 +1,115 @@
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import NamedTuple
+
+from common.candle_columns import CandleColumns
+from db.repositories.candles_1s.schema import CandleRecord
+from schemas.types import Ticker, Timeframe
+
+# Local binary snapshot of the candles buffers and of the candles not written to DB yet, section per timeframe.
+# Columns are dumped as raw machine arrays, the file is only read back by the same host.
+_MAGIC = b"CNDLSNP2"
+_HEADER = struct.Struct("<8sdI")  # magic, written at, timeframes
+_TIMEFRAME_HEADER = struct.Struct("<4sII")  # timeframe, tickers, pending records
+_TICKER_HEADER = struct.Struct("<HI")  # ticker length, candles count
+_TICKER_LEN = struct.Struct("<H")
+_PENDING_VALUES = struct.Struct("<q5d")  # t, o, c, h, l, v
+
+
+class BufferSnapshotError(Exception):
+    ...
+
+
+class TimeframeSnapshot(NamedTuple):
+    buffer: list[tuple[Ticker, CandleColumns]]
+    pending: list[CandleRecord]
+
+
+class Snapshot(NamedTuple):
+    written_at: float
+    timeframes: dict[Timeframe, TimeframeSnapshot]
+
+
+def snapshot_path(directory: str | Path, shard: int) -> Path:
+    return Path(directory) / f"buffer_{shard}.snap"
+
+
+class BufferSnapshot:
+    """Snapshot file is replaced atomically, so crash while writing keeps the previous one"""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+
+    def write(self, snapshot: Snapshot) -> int:
+        """Returns size of the written snapshot in bytes"""
+        tmp_path = self._path.with_suffix(".tmp")
+        with tmp_path.open("wb") as f:
+            f.write(_HEADER.pack(_MAGIC, snapshot.written_at, len(snapshot.timeframes)))
+            for timeframe, (buffer, pending) in snapshot.timeframes.items():
+                f.write(_TIMEFRAME_HEADER.pack(timeframe.encode(), len(buffer), len(pending)))
+                for ticker, columns in buffer:
+                    encoded = ticker.encode()
+                    f.write(_TICKER_HEADER.pack(len(encoded), len(columns[0])))
+                    f.write(encoded)
+                    for column in columns:
+                        column.tofile(f)
+                for ticker, *values in pending:
+                    encoded = ticker.encode()
+                    f.write(_TICKER_LEN.pack(len(encoded)))
+                    f.write(encoded)
+                    f.write(_PENDING_VALUES.pack(*values))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        tmp_path.replace(self._path)
+        return size
+
+    def read(self) -> Snapshot | None:
+        """None if there is no snapshot. Raises BufferSnapshotError if snapshot is corrupted."""
+        try:
+            data = memoryview(self._path.read_bytes())
+        except FileNotFoundError:
+            return None
+        try:
+            return _parse(data)
+        except (struct.error, ValueError, UnicodeDecodeError) as ex:
+            raise BufferSnapshotError(f"Corrupted snapshot {self._path}") from ex
+
+
+def _parse(data: memoryview) -> Snapshot:
+    magic, written_at, timeframes_count = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("Not a buffer snapshot")
+    offset = _HEADER.size
+    timeframes: dict[Timeframe, TimeframeSnapshot] = {}
+    for _ in range(timeframes_count):
+        timeframe, tickers, pending_count = _TIMEFRAME_HEADER.unpack_from(data, offset)
+        offset += _TIMEFRAME_HEADER.size
+        buffer: list[tuple[Ticker, CandleColumns]] = []
+        for _ in range(tickers):
+            ticker_len, count = _TICKER_HEADER.unpack_from(data, offset)
+            offset += _TICKER_HEADER.size
+            ticker = Ticker(bytes(data[offset:offset + ticker_len]).decode())
+            offset += ticker_len
+            columns = []
+            for typecode in "qddddd":
+                column = array(typecode)
+                size = count * column.itemsize
+                if offset + size > len(data):
+                    raise ValueError("Truncated snapshot")
+                column.frombytes(data[offset:offset + size])
+                columns.append(column)
+                offset += size
+            buffer.append((ticker, tuple(columns)))  # type: ignore[arg-type]
+        pending: list[CandleRecord] = []
+        for _ in range(pending_count):
+            (ticker_len,) = _TICKER_LEN.unpack_from(data, offset)
+            offset += _TICKER_LEN.size
+            ticker = Ticker(bytes(data[offset:offset + ticker_len]).decode())
+            offset += ticker_len
+            pending.append((ticker, *_PENDING_VALUES.unpack_from(data, offset)))
+            offset += _PENDING_VALUES.size
+        timeframes[Timeframe(timeframe.rstrip(b"\0").decode())] = TimeframeSnapshot(buffer, pending)
+    return Snapshot(written_at, timeframes)
@@ -1,74 +1,496 @@
 import asyncio
+import time
 import traceback
-from collections import defaultdict
-from collections.abc import Iterable
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Sequence
 from datetime import UTC, datetime, timedelta
+from itertools import batched, islice
 from time import monotonic
 
 from loguru import logger
 
+from common.candle_columns import CandleColumns, empty_columns
+from common.candles_table import CandleRow, CandlesTableWriter
+from common.metrics import SIZE_BUCKETS, Counter, Gauge, Histogram
 from db.repositories import DB
-from quote_consumer.core.settings import settings
-from schemas.types import Candle, Ticker, Timestamp, Trade
+from db.repositories.candles.repo import CandlesRepo
+from db.repositories.candles_1s.schema import CandleRecord
+from quote_consumer.buffer_snapshot import (
+    BufferSnapshot,
+    BufferSnapshotError,
+    Snapshot,
+    TimeframeSnapshot,
+)
+from quote_consumer.core.settings import TradesToCandleProcessorConfigs, settings
+from schemas.types import Candle, RawTrade, Ticker, Timeframe
 
-type CandleBuffer = dict[Ticker, dict[Timestamp, Candle]]
+TRADES_PROCESSED = Counter("trades_processed", "Trades aggregated into candles")
+TRADE_LAG = Histogram("trade_lag_seconds", "Delay of processing into candles after the trade time, last trade of a batch")
+BUFFER_CANDLES = Gauge("candles_buffer_candles", "Candles in memory buffer per ticker", ["timeframe", "ticker"])
+FLUSH_CANDLES = Histogram("candles_flush_candles", "Candles written per flush", ["table"], buckets=SIZE_BUCKETS)
+FLUSH_DURATION = Histogram("candles_flush_duration_seconds", "Duration of flushes", ["table"])
+FLUSH_FAILED_CHUNKS = Counter("candles_flush_failed_chunks", "Chunks not written after all retries", ["table"])
+UNACKED_CANDLES = Gauge("candles_unacked", "Candles not acknowledged by DB, kept for the next flush", ["table"])
+
+
+class TickerCandles:
+    """
+    Candles of the ticker ordered by time, stored column wise in plain float64 arrays.
+    Evicted candles are only skipped by moving the head, storage is compacted once head passes the half.
+    Pydantic `Candle` is built only when candle leaves the buffer (API, DB).
+    `dirty_from` is the flush watermark: the oldest timestamp changed since the last flush, None when not changed.
+    """
+
+    __slots__ = ("_c", "_h", "_head", "_l", "_o", "_t", "_v", "dirty_from", "ticker")
+
+    def __init__(self, ticker: Ticker, columns: CandleColumns | None = None) -> None:
+        self.ticker = ticker
+        self.dirty_from: int | None = None
+        if columns is None:
+            columns = empty_columns()
+        # Timestamps are in seconds
+        self._t, self._o, self._h, self._l, self._c, self._v = columns
+        self._head = 0
+
+    def __len__(self) -> int:
+        return len(self._t) - self._head
+
+    def latest(self) -> Candle | None:
+        return self._candle(len(self._t) - 1) if len(self._t) > self._head else None
+
+    def latest_row(self) -> CandleRow | None:
+        if (idx := len(self._t) - 1) < self._head:
+            return None
+        return self._t[idx], self._o[idx], self._c[idx], self._l[idx], self._h[idx], self._v[idx]
+
+    def get(self, timestamp: int) -> Candle | None:
+        return None if (idx := self._index(timestamp)) is None else self._candle(idx)
+
+    def take_dirty_records(self) -> list[CandleRecord]:
+        """Candles changed since the previous call. Trades come mostly in order, so all of them are after watermark."""
+        records, self.dirty_from = self.dirty_records(), None
+        return records
+
+    def dirty_records(self) -> list[CandleRecord]:
+        """Candles changed since the previous take, watermark is kept"""
+        if self.dirty_from is None:
+            return []
+        start = bisect_left(self._t, self.dirty_from, lo=self._head)
+        ticker, t, o, c, h, l, v = self.ticker, self._t, self._o, self._c, self._h, self._l, self._v
+        return [(ticker, t[idx], o[idx], c[idx], h[idx], l[idx], v[idx]) for idx in range(start, len(t))]
+
+    def at_or_before(self, timestamp: int) -> Candle | None:
+        """Candle at exact timestamp or the closest older one"""
+        idx = bisect_right(self._t, timestamp, lo=self._head) - 1
+        return self._candle(idx) if idx >= self._head else None
+
+    def add_trade(self, timestamp: int, price: float, qty: float) -> None:
+        t = self._t
+        # Trades come mostly in order, so the latest candle is either updated or a new one is appended
+        if len(t) > self._head and timestamp <= t[-1]:
+            idx = len(t) - 1 if timestamp == t[-1] else self._index(timestamp)
+            if idx is not None:
+                self._c[idx] = price
+                if price > self._h[idx]:
+                    self._h[idx] = price
+                elif price < self._l[idx]:
+                    self._l[idx] = price
+                self._v[idx] += qty
+                return
+        self.put(timestamp, price, price, price, price, qty)
+
+    def put(self, timestamp: int, o: float, h: float, l: float, c: float, v: float) -> None:  # noqa: PLR0913, PLR0917
+        t = self._t
+        if len(t) == self._head or timestamp > t[-1]:
+            idx = len(t)
+        elif (idx := bisect_left(t, timestamp, lo=self._head)) < len(t) and t[idx] == timestamp:
+            self._o[idx], self._h[idx], self._l[idx], self._c[idx], self._v[idx] = o, h, l, c, v
+            return
+        t.insert(idx, timestamp)
+        self._o.insert(idx, o)
+        self._h.insert(idx, h)
+        self._l.insert(idx, l)
+        self._c.insert(idx, c)
+        self._v.insert(idx, v)
+
+    def columns(self, from_: int | None = None, till: int | None = None) -> CandleColumns:
+        """Copy of t, o, h, l, c, v columns of the candles in the buffer, only of [from_, till) if bounds are given"""
+        start = self._head if from_ is None else bisect_left(self._t, from_, lo=self._head)
+        end = len(self._t) if till is None else bisect_left(self._t, till, lo=start)
+        return self._t[start:end], self._o[start:end], self._h[start:end], self._l[start:end], self._c[start:end], self._v[start:end]
+
+    def merge_older(self, records: Iterable[CandleRecord]) -> None:
+        """
+        Merge candles loaded from DB while trades of the ticker are already being received.
+        Second present in both is combined, stored candle holds trades received before restart.
+        """
+        for _, timestamp, o, c, h, l, v in records:
+            if (idx := self._index(timestamp)) is None:
+                self.put(timestamp, o, h, l, c, v)
+                continue
+            self._o[idx] = o
+            self._h[idx] = max(h, self._h[idx])
+            self._l[idx] = min(l, self._l[idx])
+            self._v[idx] += v
+            if self.dirty_from is None or timestamp < self.dirty_from:
+                self.dirty_from = timestamp
+
+    def trim(self, till: float) -> int:
+        """Remove candles with timestamp less or equal to `till`. Returns removed candles count."""
+        idx = bisect_right(self._t, till, lo=self._head)
+        removed, self._head = idx - self._head, idx
+        if self._head * 2 >= len(self._t):
+            for column in (self._t, self._o, self._h, self._l, self._c, self._v):
+                del column[:self._head]
+            self._head = 0
+        return removed
+
+    def _index(self, timestamp: int) -> int | None:
+        idx = bisect_left(self._t, timestamp, lo=self._head)
+        return idx if idx < len(self._t) and self._t[idx] == timestamp else None
+
+    def _candle(self, idx: int) -> Candle:
+        return Candle.from_floats(
+            self.ticker, self._t[idx], o=self._o[idx], c=self._c[idx], l=self._l[idx], h=self._h[idx], v=self._v[idx]
+        )
+
+
+class CandleBuffer(dict[Ticker, TickerCandles]):
+    """`covered_from` is the timestamp since which buffer holds all candles, None until loaded from DB"""
+
+    covered_from: int | None = None
+
+    def __missing__(self, ticker: Ticker) -> TickerCandles:
+        self[ticker] = ticker_candles = TickerCandles(ticker)
+        return ticker_candles
+
+
+class CandlesFlusher:
+    """
+    Writes snapshots of changed candles to DB by chunks with bounded concurrency and retries.
+    Candles not acknowledged by DB are kept and replayed with the next flush, newer snapshot of a candle wins.
+    """
+
+    def __init__(self, configs: TradesToCandleProcessorConfigs, repo: CandlesRepo) -> None:
+        self._configs = configs
+        self._repo = repo
+        self._unacked: dict[tuple[Ticker, int], CandleRecord] = {}
+        self._in_flight: list[CandleRecord] = []
+        self._flush_candles = FLUSH_CANDLES.labels(repo.table_name)
+        self._flush_duration = FLUSH_DURATION.labels(repo.table_name)
+        self._failed_chunks = FLUSH_FAILED_CHUNKS.labels(repo.table_name)
+        self._unacked_candles = UNACKED_CANDLES.labels(repo.table_name)
+
+    @property
+    def unacked_count(self) -> int:
+        return len(self._unacked)
+
+    def pending_records(self) -> list[CandleRecord]:
+        """Candles not acknowledged by DB yet, including the ones being written"""
+        return [*self._in_flight, *self._unacked.values()]
+
+    def add(self, records: Iterable[CandleRecord]) -> None:
+        unacked = self._unacked
+        for record in records:
+            unacked[record[0], record[1]] = record
+        if (overflow := len(unacked) - self._configs.flush_max_unacked) > 0:
+            for key in list(islice(unacked, overflow)):
+                del unacked[key]
+            logger.error(f"Too many candles not flushed to {self._repo.table_name}, dropped the oldest: {overflow}")
+
+    async def flush(self) -> None:
+        if not self._unacked:
+            return
+        t_start = monotonic()
+        records, self._unacked = list(self._unacked.values()), {}
+        self._in_flight = records
+        semaphore = asyncio.Semaphore(self._configs.flush_concurrency)
+        chunks = list(batched(records, self._configs.flush_chunk_size))
+        try:
+            written = await asyncio.gather(*(self._write_chunk(chunk, semaphore) for chunk in chunks))
+        except asyncio.CancelledError:
+            self._restore(records)
+            raise
+        finally:
+            self._in_flight = []
+        for chunk, ok in zip(chunks, written, strict=True):
+            if not ok:
+                self._failed_chunks.inc()
+                self._restore(chunk)
+        self._flush_candles.observe(len(records))
+        self._flush_duration.observe(monotonic() - t_start)
+        self._unacked_candles.set(len(self._unacked))
+        if self._unacked:
+            logger.error(f"Candles of {self._repo.table_name} kept for the next flush: {len(self._unacked)}")
+
+    async def _write_chunk(self, chunk: Sequence[CandleRecord], semaphore: asyncio.Semaphore) -> bool:
+        async with semaphore:
+            for attempt in range(self._configs.flush_retries):
+                if attempt:
+                    await asyncio.sleep(min(2 ** attempt * 0.5, 10))
+                try:
+                    if self._configs.flush_mode == "copy":
+                        await self._repo.bulk_upsert_copy(chunk)
+                    else:
+                        await self._repo.bulk_upsert(_record_to_candle(rec) for rec in chunk)
+                except Exception:
+                    logger.error(f"Cannot flush to {self._repo.table_name}, attempt: {attempt + 1}")
+                    logger.error(traceback.format_exc())
+                    continue
+                return True
+        return False
+
+    def _restore(self, records: Iterable[CandleRecord]) -> None:
+        # Candles changed since the snapshot are already in unacked with newer values
+        for record in records:
+            self._unacked.setdefault((record[0], record[1]), record)
+
+
+class TimeframeCandles:
+    """
+    Candles of a single timeframe aggregated from the trades: in memory buffer, tickers with candles changed since
+    the previous flush and the writer of the timeframe table.
+    """
+
+    def __init__(
+        self, timeframe: Timeframe, configs: TradesToCandleProcessorConfigs, buffer_interval: int, storage_max_interval: int
+    ) -> None:
+        self.timeframe = timeframe
+        self.buffer_interval = buffer_interval
+        self.storage_max_interval = storage_max_interval
+        self.repo = DB.candles(timeframe)
+        self.buffer = CandleBuffer()
+        self.dirty_tickers: list[TickerCandles] = []
+        self.flusher = CandlesFlusher(configs, self.repo)
+
+    def add_trades(self, trades: list[RawTrade]) -> None:
+        buffer, dirty_tickers, seconds = self.buffer, self.dirty_tickers, self.timeframe.seconds
+        for ticker, t, price, qty, _ in trades:
+            aligned_t = t // 1000  # Milliseconds alined to seconds
+            aligned_t -= aligned_t % seconds
+            ticker_candles = buffer[ticker]
+            ticker_candles.add_trade(aligned_t, price, qty)
+            # Move flush watermark of the ticker only when it becomes dirty or on out of order trade
+            if (dirty_from := ticker_candles.dirty_from) is None:
+                ticker_candles.dirty_from = aligned_t
+                dirty_tickers.append(ticker_candles)
+            elif aligned_t < dirty_from:
+                ticker_candles.dirty_from = aligned_t
+
+    def trim(self, now: float) -> int:
+        remove_till = now - self.buffer_interval
+        if self.buffer.covered_from is not None:
+            self.buffer.covered_from = max(self.buffer.covered_from, int(remove_till) + 1)
+        return sum(ticker_candles.trim(remove_till) for ticker_candles in self.buffer.values())
+
+    def take_flushable(self) -> list[CandleRecord]:
+        """Snapshot of candles changed since the previous flush"""
+        dirty_tickers, self.dirty_tickers = self.dirty_tickers, []
+        records: list[CandleRecord] = []
+        for ticker_candles in dirty_tickers:
+            records.extend(ticker_candles.take_dirty_records())
+        logger.info(f"Candles to flush to {self.repo.table_name}: {len(records)}. Tickers: {len(dirty_tickers)}")
+        return records
+
+    def to_snapshot(self) -> TimeframeSnapshot:
+        pending = self.flusher.pending_records()
+        buffer = []
+        for ticker, ticker_candles in self.buffer.items():
+            if len(ticker_candles):
+                buffer.append((ticker, ticker_candles.columns()))
+            pending.extend(ticker_candles.dirty_records())
+        return TimeframeSnapshot(buffer, pending)
+
+    def restore(self, snapshot: TimeframeSnapshot) -> None:
+        for ticker, columns in snapshot.buffer:
+            self.buffer[ticker] = TickerCandles(ticker, columns)
+        # Candles not written before the restart go straight to the flusher, so buffer trimming cannot lose them
+        self.flusher.add(snapshot.pending)
+
+    async def load(self, batch_size: int, skip_till: int | None = None) -> int:
+        """
+        Merge candles of the buffer interval from DB into the buffer. Returns number of loaded candles.
+        Candles starting till `skip_till` second inclusive are already restored from the snapshot, which is newer than DB.
+        """
+        cdl_count = 0
+        from_ = datetime.now(UTC) - timedelta(seconds=self.buffer_interval)
+        ticker_records: list[CandleRecord] = []
+        async for records in self.repo.iter_candle_records(from_, batch_size):
+            for record in records:
+                if skip_till is not None and record[1] <= skip_till:
+                    continue
+                if ticker_records and ticker_records[0][0] != record[0]:
+                    self._merge_loaded(ticker_records)
+                    ticker_records = []
+                ticker_records.append(record)
+            cdl_count += len(records)
+        if ticker_records:
+            self._merge_loaded(ticker_records)
+        self.buffer.covered_from = int(from_.timestamp())
+        return cdl_count
+
+    def _merge_loaded(self, records: list[CandleRecord]) -> None:
+        """Records are of the single ticker ordered by time"""
+        ticker_candles = self.buffer[Ticker(records[0][0])]
+        was_clean = ticker_candles.dirty_from is None
+        ticker_candles.merge_older(records)
+        if was_clean and ticker_candles.dirty_from is not None:
+            self.dirty_tickers.append(ticker_candles)
 
 
 class TradesToCandleProcessor:
-    def __init__(self, data_provider: asyncio.Queue[Trade]) -> None:
+    def __init__(
+        self,
+        data_provider: asyncio.Queue[list[RawTrade]],
+        *,
+        remove_old_candles: bool = True,
+        candles_table: CandlesTableWriter | None = None,
+        snapshot: BufferSnapshot | None = None,
+        replay: bool = False,
+    ) -> None:
         self._configs = settings.TRADES_TO_CANDLES_CONFIG
         self._data_provider = data_provider
-        self._storage_buffer: CandleBuffer = defaultdict(dict)
-        self._tickers_with_updated_prices: dict[Ticker, set[Timestamp]] = defaultdict(set)
+        self._remove_old_candles = remove_old_candles
+        # Replayed trades are aggregated in memory only, buffer is trimmed by the time of the trades, not the wall clock
+        self._replay = replay
+        self._last_trade_at = 0  # in ms
+        self._candles_table = candles_table
+        self._snapshot = snapshot
+        # 1s candles first, higher timeframes are rolled up from the same trades
+        self._candles_1s = TimeframeCandles(
+            Timeframe.S1, self._configs, self._configs.buffer_interval, self._configs.storage_max_interval
+        )
+        self._timeframes = [self._candles_1s] + [
+            TimeframeCandles(timeframe, self._configs, rollup.buffer_interval, rollup.storage_max_interval)
+            for timeframe, rollup in self._configs.rollups.items()
+        ]
         self._background_tasks: list[asyncio.Task[None]] = []
+        self._trades_processed = TRADES_PROCESSED.labels()
+        self._trade_lag = TRADE_LAG.labels()
+        BUFFER_CANDLES.set_function(self._buffer_sizes)
 
     @property
-    def buffer(self) -> CandleBuffer:
-        return self._storage_buffer
+    def buffers(self) -> dict[Timeframe, CandleBuffer]:
+        return {tf_candles.timeframe: tf_candles.buffer for tf_candles in self._timeframes}
 
     async def run(self) -> None:
-        # TODO: Load from database initial state
-        await self._load_buffer()
+        if self._replay:
+            self._background_tasks.extend([
+                asyncio.create_task(self._periodic_buffer_cleaner()),
+                asyncio.create_task(self._trades_to_buffer_processor()),
+            ])
+            if self._candles_table is not None:
+                self._background_tasks.append(asyncio.create_task(self._periodic_candles_table_publisher(self._candles_table)))
+            return
+        # Snapshot is restored before any trade, DB candles are then reconciled with it
+        snapshot_till = await self._restore_snapshot(self._snapshot) if self._snapshot is not None else None
+        # Trades are consumed right away, candles loaded from DB are merged into the live ones
         self._background_tasks.extend([
             asyncio.create_task(self._periodic_flusher_to_db()),
-            asyncio.create_task(self._periodic_old_candles_remover()),
             asyncio.create_task(self._periodic_buffer_cleaner()),
             asyncio.create_task(self._trades_to_buffer_processor())
         ])
+        if self._remove_old_candles:
+            self._background_tasks.append(asyncio.create_task(self._periodic_old_candles_remover()))
+        if self._candles_table is not None:
+            self._background_tasks.append(asyncio.create_task(self._periodic_candles_table_publisher(self._candles_table)))
+        if self._snapshot is not None:
+            self._background_tasks.append(asyncio.create_task(self._periodic_snapshot_writer(self._snapshot)))
+        await self._load_buffer(skip_till=snapshot_till)
 
     async def stop(self) -> None:
         for tsk in self._background_tasks:
             tsk.cancel()
-        await self._flush()
+        # Cancelled flush restores its in-flight records, the final flush has to see them
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        if not self._replay:
+            await self._flush()
+        # Candles DB has not acknowledged survive the restart
+        if self._snapshot is not None:
+            await self._write_snapshot(self._snapshot)
+        if self._candles_table is not None:
+            self._candles_table.close()
 
     async def _trades_to_buffer_processor(self) -> None:
-        while trade := await self._data_provider.get():
-            aligned_t = Timestamp(trade.t // 1000)  # Milliseconds alined to seconds
-            # Used to control which candles must be flushed to DB
-            self._tickers_with_updated_prices[trade.T].add(aligned_t)
-            ticker_buffer = self._storage_buffer[trade.T]
-            if (candle := ticker_buffer.get(aligned_t)) is None:
-                ticker_buffer[aligned_t] = trade.to_candle()
-                continue
-            candle.update(trade)
+        queue = self._data_provider
+        while True:
+            self._add_trades(await queue.get())
+            # Drain all batches already waiting in the queue in the same wake up
+            while not queue.empty():
+                self._add_trades(queue.get_nowait())
+
+    def _add_trades(self, trades: list[RawTrade]) -> None:
+        for tf_candles in self._timeframes:
+            tf_candles.add_trades(trades)
+        # Per batch, so metrics stay off the per trade path
+        self._trades_processed.inc(len(trades))
+        if trades:
+            self._last_trade_at = max(self._last_trade_at, trades[-1][1])
+            self._trade_lag.observe(time.time() - trades[-1][1] / 1000)
+
+    def _buffer_sizes(self) -> Iterable[tuple[tuple[str, str], int]]:
+        for tf_candles in self._timeframes:
+            for ticker, ticker_candles in tf_candles.buffer.items():
+                yield (tf_candles.timeframe, ticker), len(ticker_candles)
 
     async def _periodic_buffer_cleaner(self) -> None:
         while True:
             await asyncio.sleep(self._configs.buffer_clean_period)
-            remove_till = datetime.now(tz=UTC).timestamp() - self._configs.buffer_interval
-            to_remove_count = 0
-            for ts_to_candle in self._storage_buffer.values():
-                ts_to_remove: list[Timestamp] = []
-                for ts in ts_to_candle:
-                    if ts <= remove_till:
-                        ts_to_remove.append(ts)
-                        to_remove_count += 1
+            now = self._last_trade_at / 1000 if self._replay else datetime.now(tz=UTC).timestamp()
+            for tf_candles in self._timeframes:
+                to_remove_count = tf_candles.trim(now)
+                msg = f"Buffer {tf_candles.timeframe} removed candles count: {to_remove_count}"
+                logger.info(f"{msg}. Tickers in buffer: {len(tf_candles.buffer)}")
+            logger.info(f"Trades queue batches: {self._data_provider.qsize()}/{self._data_provider.maxsize}")
+
+    async def _periodic_candles_table_publisher(self, candles_table: CandlesTableWriter) -> None:
+        published: dict[Ticker, CandleRow] = {}
+        while True:
+            await asyncio.sleep(self._configs.candles_table_publish_period)
+            for ticker, ticker_candles in self._candles_1s.buffer.items():
+                if (row := ticker_candles.latest_row()) is None or published.get(ticker) == row:
+                    continue
+                if candles_table.publish(ticker, row):
+                    published[ticker] = row
+            candles_table.heartbeat()
 
-                for ts in ts_to_remove:
-                    ts_to_candle.pop(ts, None)
+    async def _periodic_snapshot_writer(self, snapshot: BufferSnapshot) -> None:
+        while True:
+            await asyncio.sleep(self._configs.snapshot_period)
+            await self._write_snapshot(snapshot)
+
+    async def _write_snapshot(self, snapshot_file: BufferSnapshot) -> None:
+        t_start = monotonic()
+        # Columns are copied synchronously, so file is written in a thread without blocking trades processing
+        snapshot = Snapshot(time.time(), {tf_candles.timeframe: tf_candles.to_snapshot() for tf_candles in self._timeframes})
+        try:
+            size = await asyncio.to_thread(snapshot_file.write, snapshot)
+        except OSError:
+            logger.error("Cannot write buffer snapshot.")
+            logger.error(traceback.format_exc())
+            return
+        pending = sum(len(tf_snapshot.pending) for tf_snapshot in snapshot.timeframes.values())
+        logger.debug(f"Snapshot written: {size} bytes, pending candles: {pending}. In {monotonic() - t_start:.3f}s")
 
-            msg = f"Buffer removed candles count: {to_remove_count}. Tickers in buffer: {len(self._storage_buffer)}"
-            logger.info(msg)
+    async def _restore_snapshot(self, snapshot_file: BufferSnapshot) -> int | None:
+        """Restore buffers from the snapshot. Returns the last second the snapshot is authoritative for."""
+        t_start = monotonic()
+        try:
+            snapshot = await asyncio.to_thread(snapshot_file.read)
+        except (OSError, BufferSnapshotError):
+            logger.error("Cannot read buffer snapshot, loading from storage only.")
+            logger.error(traceback.format_exc())
+            return None
+        if snapshot is None:
+            return None
+        for tf_candles in self._timeframes:
+            if (tf_snapshot := snapshot.timeframes.get(tf_candles.timeframe)) is None:
+                continue
+            tf_candles.restore(tf_snapshot)
+            msg = f"Tickers: {len(tf_snapshot.buffer)}, pending candles: {len(tf_snapshot.pending)}"
+            logger.info(f"Snapshot {tf_candles.timeframe} restored. {msg}")
+        logger.info(f"Snapshot restored in: {timedelta(seconds=monotonic() - t_start)}s")
+        return int(snapshot.written_at)
 
     async def _periodic_flusher_to_db(self) -> None:
         while True:
@@ -77,46 +499,45 @@ class TradesToCandleProcessor:
 
     async def _periodic_old_candles_remover(self) -> None:
         while True:
-            await asyncio.sleep(self._configs.storage_clean_period)
             t_start = monotonic()
-            del_till = datetime.now(tz=UTC) - timedelta(days=self._configs.storage_max_interval)
-            logger.info(f"Removing candles older than {del_till}")
+            now = datetime.now(tz=UTC)
             try:
-                await DB.candles_1s.remove_old_candles(del_till)
+                created = await DB.candles_1s.create_partitions(
+                    now.date(), now.date() + timedelta(days=self._configs.storage_partitions_ahead)
+                )
+                logger.info(f"Partitions of candles_1s created: {created}")
             except Exception:
-                logger.error("Cannot remove old candles from storage.")
+                logger.error("Cannot create candles storage partitions.")
                 logger.error(traceback.format_exc())
-                continue
-            logger.info(f"Removed in {timedelta(seconds=monotonic() - t_start)}s")
-
-    def _get_flushable_candles(self) -> Iterable[Candle]:
-        candles_count = 0
-        for ticker, tss in self._tickers_with_updated_prices.items():
-            for ts in tss:
-                if ts not in self._storage_buffer[ticker]:
+            for tf_candles in self._timeframes:
+                del_till = now - timedelta(days=tf_candles.storage_max_interval)
+                logger.info(f"Removing candles of {tf_candles.repo.table_name} older than {del_till}")
+                try:
+                    # Whole expired partitions for 1s candles, expired rows for rollups
+                    removed = await tf_candles.repo.remove_old_candles(del_till)
+                except Exception:
+                    logger.error(f"Cannot remove old candles from {tf_candles.repo.table_name}.")
+                    logger.error(traceback.format_exc())
                     continue
-                candles_count += 1
-                yield self._storage_buffer[ticker][ts]
-        # Restore the state
-        tkrs_updt_price = len(self._tickers_with_updated_prices)
-        logger.info(f"Candles to flush: {candles_count}. Tickers: {tkrs_updt_price}")
-        self._tickers_with_updated_prices = defaultdict(set)
+                logger.info(f"Removed from {tf_candles.repo.table_name}: {removed}")
+            logger.info(f"Storage retention done in {timedelta(seconds=monotonic() - t_start)}s")
+            await asyncio.sleep(self._configs.storage_clean_period)
 
     async def _flush(self) -> None:
         t_start = monotonic()
-        try:
-            await DB.candles_1s.bulk_upsert(self._get_flushable_candles())
-        except Exception:
-            logger.error("Cannot flush to storage")
-            logger.error(traceback.format_exc())
-            return
+        # Snapshot is taken synchronously, so trades processed during the write go to the next flush
+        for tf_candles in self._timeframes:
+            tf_candles.flusher.add(tf_candles.take_flushable())
+        await asyncio.gather(*(tf_candles.flusher.flush() for tf_candles in self._timeframes))
         logger.info(f"Flushed in: {timedelta(seconds=monotonic() - t_start)}")
 
-    async def _load_buffer(self) -> None:
-        cdl_count, t_start = 0, monotonic()
-        from_ = datetime.now(UTC) - timedelta(seconds=self._configs.buffer_interval)
-        async for cdl in DB.candles_1s.get_candles(from_=from_):
-            self._storage_buffer[cdl.T][Timestamp.from_dt(cdl.t)] = cdl
-            cdl_count += 1
-        logger.info(f"Candles loaded: {cdl_count}. In: {timedelta(seconds=monotonic() - t_start)}s")
+    async def _load_buffer(self, skip_till: int | None = None) -> None:
+        t_start = monotonic()
+        batch_size = self._configs.warm_start_batch_size
+        loaded = await asyncio.gather(*(tf_candles.load(batch_size, skip_till) for tf_candles in self._timeframes))
+        logger.info(f"Candles loaded: {sum(loaded)}. In: {timedelta(seconds=monotonic() - t_start)}s")
+
 
+def _record_to_candle(record: CandleRecord) -> Candle:
+    ticker, t, o, c, h, l, v = record
+    return Candle.from_floats(ticker, t, o=o, c=c, l=l, h=h, v=v)
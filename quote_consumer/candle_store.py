@@ -0,0 +1,128 @@
+from collections.abc import Sequence
+from typing import NamedTuple
+
+from common.candle_columns import CandleColumns
+from common.candles_table import CandleRow
+from common.metrics import REGISTRY, MetricFamily
+from db.repositories import DB
+from quote_consumer.candle_processor import CandleBuffer
+from quote_consumer.ws_connector.base import RTTradesProvider
+from schemas.types import Candle, Market, Ticker, Timeframe, Timestamp
+
+
+class CandleStoreError(Exception):
+    ...
+
+
+class CandleNotFoundError(CandleStoreError):
+    """Raised with the reason of missing candle as the message"""
+
+
+class CandleStoreUnavailableError(CandleStoreError):
+    ...
+
+
+class CandleLookup(NamedTuple):
+    ticker: Ticker
+    timestamp: Timestamp | None = None
+
+
+class CandleRange(NamedTuple):
+    covered_from: int | None  # Memory holds all candles since this timestamp, None if buffer is not loaded yet
+    columns: list[tuple[Ticker, CandleColumns]]  # Non empty columns of the tickers from `covered_from`
+
+
+class CandleStore:
+    """In memory candles as seen by the API, either of this process or of the shard processes"""
+
+    async def get_candle(  # type: ignore
+        self, ticker: Ticker, timestamp: Timestamp | None = None, timeframe: Timeframe = Timeframe.S1
+    ) -> Candle:
+        """Latest candle of the ticker or the one at timestamp or closest older one if timestamp provided"""
+
+    async def get_candles(self, lookups: Sequence[CandleLookup]) -> list[Candle | CandleStoreError]:  # type: ignore
+        """Candles of many lookups at once in the order of lookups, candle which cannot be found is returned as error"""
+
+    async def get_candle_range(  # type: ignore
+        self, tickers: Sequence[Ticker], from_: int, till: int, timeframe: Timeframe = Timeframe.S1
+    ) -> CandleRange:
+        """Candles of the tickers in [from_, till) covered by memory, older ones are only in DB"""
+
+    async def get_latest_rows(self) -> dict[Ticker, CandleRow]:  # type: ignore
+        """Latest 1s candle of every ticker in memory"""
+
+    async def get_markets(self) -> list[Market]:  # type: ignore
+        """All markets of the exchanges trades are ingested from"""
+
+    async def get_stats(self) -> dict[str, int]:  # type: ignore
+        """Trades ingestion stats of processes owning the candles"""
+
+    async def get_metrics(self) -> list[MetricFamily]:  # type: ignore
+        """Metrics of processes owning the candles"""
+
+
+class LocalCandleStore(CandleStore):
+    def __init__(self, buffers: dict[Timeframe, CandleBuffer]) -> None:
+        self._buffers = buffers
+
+    async def get_candle(
+        self, ticker: Ticker, timestamp: Timestamp | None = None, timeframe: Timeframe = Timeframe.S1
+    ) -> Candle:
+        return self._lookup(ticker, timestamp, timeframe)
+
+    async def get_candles(self, lookups: Sequence[CandleLookup]) -> list[Candle | CandleStoreError]:
+        candles: list[Candle | CandleStoreError] = []
+        for ticker, timestamp in lookups:
+            try:
+                candles.append(self._lookup(ticker, timestamp))
+            except CandleNotFoundError as ex:
+                candles.append(ex)
+        return candles
+
+    async def get_candle_range(
+        self, tickers: Sequence[Ticker], from_: int, till: int, timeframe: Timeframe = Timeframe.S1
+    ) -> CandleRange:
+        if (buffer := self._buffers.get(timeframe)) is None or buffer.covered_from is None:
+            return CandleRange(None, [])
+        from_ = max(from_, buffer.covered_from)
+        columns = []
+        for ticker in tickers:
+            if (ticker_candles := buffer.get(ticker)) is None:
+                continue
+            if len((ticker_columns := ticker_candles.columns(from_, till))[0]):
+                columns.append((ticker, ticker_columns))
+        return CandleRange(buffer.covered_from, columns)
+
+    async def get_latest_rows(self) -> dict[Ticker, CandleRow]:
+        return {
+            ticker: row
+            for ticker, ticker_candles in self._buffers[Timeframe.S1].items()
+            if (row := ticker_candles.latest_row()) is not None
+        }
+
+    async def get_markets(self) -> list[Market]:
+        return RTTradesProvider.get_markets()
+
+    async def get_stats(self) -> dict[str, int]:
+        return RTTradesProvider.get_stats() | DB.get_stats()
+
+    async def get_metrics(self) -> list[MetricFamily]:
+        return REGISTRY.collect()
+
+    def _lookup(self, ticker: Ticker, timestamp: Timestamp | None, timeframe: Timeframe = Timeframe.S1) -> Candle:
+        if (buffer := self._buffers.get(timeframe)) is None:
+            raise CandleNotFoundError("timeframe_not_in_memory")
+
+        if (ticker_buffer := buffer.get(ticker)) is None:
+            raise CandleNotFoundError("ticker_not_in_memory")
+
+        if (latest_candle := ticker_buffer.latest()) is None:
+            raise CandleNotFoundError("no_candles_for_ticker")
+
+        if timestamp is None:
+            return latest_candle
+
+        # Candle at exact timestamp or the closest older one
+        if (candle := ticker_buffer.at_or_before(timestamp)) is None:
+            raise CandleNotFoundError("too_old_timestamp")
+        return candle
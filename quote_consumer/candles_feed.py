@@ -0,0 +1,90 @@
+import asyncio
+import time
+import traceback
+
+import ujson
+from loguru import logger
+
+from common.candles_table import CandleRow
+from quote_consumer.candle_store import CandleStore, CandleStoreError
+from schemas.types import Ticker
+
+# Frame of the feed: {"time": server time, "snapshot": true for the first frame, "candles": [[ticker, t, o, c, l, h, v]]}
+# Frame is pushed every period even without changed candles, so subscribers can tell the feed is alive.
+
+
+class FeedSubscription:
+    """Frames pending for a subscriber. Subscriber falling behind by more than max_pending frames is dropped."""
+
+    def __init__(self, max_pending: int) -> None:
+        self._frames: asyncio.Queue[str | None] = asyncio.Queue(maxsize=max_pending + 1)
+        self._max_pending = max_pending
+        self.dropped = False
+
+    def push(self, frame: str) -> None:
+        if self.dropped:
+            return
+        if self._frames.qsize() >= self._max_pending:
+            self.dropped = True
+            self._frames.put_nowait(None)
+            return
+        self._frames.put_nowait(frame)
+
+    async def next_frame(self) -> str | None:
+        """None once subscriber is dropped"""
+        return await self._frames.get()
+
+
+class CandlesFeed:
+    """
+    Pushes latest 1s candles to subscribers at most once per period.
+    Store is polled once per period for all subscribers, only candles changed since previous poll are pushed,
+    new subscriber gets the latest candles of all tickers first.
+    """
+
+    def __init__(self, store: CandleStore, period: float, max_pending: int) -> None:
+        self._store = store
+        self._period = period
+        self._max_pending = max_pending
+        self._latest: dict[Ticker, CandleRow] = {}
+        self._subscriptions: set[FeedSubscription] = set()
+
+    def subscribe(self) -> FeedSubscription:
+        subscription = FeedSubscription(self._max_pending)
+        subscription.push(self._encode(self._latest, snapshot=True))
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: FeedSubscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    def get_stats(self) -> dict[str, int]:
+        return {"feed_subscribers": len(self._subscriptions), "feed_tickers": len(self._latest)}
+
+    async def run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                self._publish(await self._store.get_latest_rows())
+            except CandleStoreError:
+                logger.error("Cannot get latest candles for the feed.")
+                logger.error(traceback.format_exc())
+            await asyncio.sleep(max(0.0, self._period - (time.monotonic() - started)))
+
+    def _publish(self, rows: dict[Ticker, CandleRow]) -> None:
+        changed = {ticker: row for ticker, row in rows.items() if self._latest.get(ticker) != row}
+        self._latest.update(changed)
+        if not self._subscriptions:
+            return
+        frame = self._encode(changed, snapshot=False)
+        for subscription in list(self._subscriptions):
+            subscription.push(frame)
+            if subscription.dropped:
+                logger.warning("Candles feed subscriber is too slow, dropped.")
+                self._subscriptions.discard(subscription)
+
+    @staticmethod
+    def _encode(rows: dict[Ticker, CandleRow], *, snapshot: bool) -> str:
+        return ujson.dumps(
+            {"time": time.time(), "snapshot": snapshot, "candles": [[ticker, *row] for ticker, row in rows.items()]}
+        )
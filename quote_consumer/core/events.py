@@ -1,36 +1,48 @@
 
+import asyncio
 from types import TracebackType
 
 from fastapi import FastAPI
 from loguru import logger
 
 from db.repositories import DB
-from quote_consumer.candle_processor import TradesToCandleProcessor
+from quote_consumer.candles_feed import CandlesFeed
 from quote_consumer.core.settings import settings
-from quote_consumer.ws_connector.base import RTTradesProvider
+from quote_consumer.ingestion import Ingestion
+from quote_consumer.shards import ShardProcesses
 
 
 class LifeSpan:
-    _trds_to_cndl_pr: TradesToCandleProcessor
+    _ingestion: Ingestion | ShardProcesses
+    _feed_publisher: asyncio.Task[None]
 
     def __init__(self, app: FastAPI) -> None:
         self._app = app
 
     async def __aenter__(self) -> dict:
         logger.info("Stating application")
-        await DB.connect(dsn=str(settings.DB_SERVICE))
-        await RTTradesProvider.run()
-        self._trds_to_cndl_pr = TradesToCandleProcessor(RTTradesProvider.get_trade_queue())
-        await self._trds_to_cndl_pr.run()
-        self._app.state.in_memory_storage = self._trds_to_cndl_pr.buffer
+        if settings.SHARDS > 1:
+            self._ingestion = ShardProcesses(settings.SHARDS)
+            self._app.state.candle_store = self._ingestion.start()
+            # Shards own their pools, API process reads candle ranges
+            await DB.connect(dsn=str(settings.DB_SERVICE), pools=settings.DB_POOLS)
+        else:
+            self._ingestion = Ingestion()
+            self._app.state.candle_store = await self._ingestion.start()
+        self._app.state.candles_feed = feed = CandlesFeed(
+            self._app.state.candle_store, settings.CANDLES_FEED_PERIOD, settings.CANDLES_FEED_MAX_PENDING
+        )
+        self._feed_publisher = asyncio.create_task(feed.run())
         return {}
 
     async def __aexit__(
         self, exc_type: type[BaseException] | None, exc_val: BaseException | None, traceback: TracebackType | None
     ) -> None:
         logger.info("Stopping application")
-        await RTTradesProvider.stop()
-        await self._trds_to_cndl_pr.stop()
-        await DB.disconnect()
-        del self._app.state.in_memory_storage
+        self._feed_publisher.cancel()
+        del self._app.state.candles_feed
+        await self._ingestion.stop()
+        if settings.SHARDS > 1:
+            await DB.disconnect()
+        del self._app.state.candle_store
 
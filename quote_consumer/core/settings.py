@@ -1,17 +1,43 @@
 import logging
 import sys
+from typing import Literal
 
 from loguru import logger
 from pydantic import BaseModel, Field, PostgresDsn
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from db.repositories.base import DBLane, PoolConfigs
+from schemas.types import Timeframe
+
+
+class RollupConfigs(BaseModel):
+    buffer_interval: int  # Candles are stored in memory maximum for this number of seconds
+    storage_max_interval: int  # Maximum time period of candles in DB in days
+
 
 class TradesToCandleProcessorConfigs(BaseModel):
     flush_to_db_period: int = 30  # Flush candles every 30 second to DB
+    flush_mode: Literal["copy", "executemany"] = "copy"  # Binary COPY into staging table or row by row upsert
+    flush_chunk_size: int = 20_000  # Flushed candles are written by chunks
+    flush_concurrency: int = 2  # Maximum number of chunks written in parallel
+    flush_retries: int = 3  # Attempts to write a chunk before keeping it for the next flush
+    flush_max_unacked: int = 2_000_000  # Candles kept for replay while DB is down, the oldest are dropped above
     buffer_interval: int = 60  # Buffer candles are stored maximum for 60 seconds
     buffer_clean_period: int = 45  # Clean in memory buffer every 45 seconds
-    storage_max_interval: int = 7  # Maximum time period of candles in days
-    storage_clean_period: int = 600  # Clean every 10 minutes old candles from DB
+    storage_max_interval: int = 7  # Maximum time period of candles in days, expired days are dropped as a whole
+    storage_clean_period: int = 600  # Every 10 minutes drop expired and create upcoming daily partitions in DB
+    storage_partitions_ahead: int = 3  # Daily partitions are created this number of days in advance
+    warm_start_batch_size: int = 10_000  # Candles fetched from DB per round trip while loading the buffer on start
+    trades_batch_size: int = 500  # Trades of a connection are handed over to processor by batches of this size
+    trades_batch_max_delay: float = 0.05  # or after this delay in seconds when batch is not full
+    trades_queue_size: int = 1_000  # Maximum number of batches waiting for processor, newer batches are dropped
+    candles_table_publish_period: float = 0.2  # Publish latest candles into shared memory table every 200ms
+    snapshot_period: float = 5  # Write buffer snapshot to local disk every 5 seconds
+    # Higher timeframes aggregated from the same trades as 1s candles, each into its own table
+    rollups: dict[Timeframe, RollupConfigs] = {
+        Timeframe.M1: RollupConfigs(buffer_interval=3_600, storage_max_interval=90),
+        Timeframe.H1: RollupConfigs(buffer_interval=2 * 86_400, storage_max_interval=730),
+    }
 
 
 class Settings(BaseSettings):
@@ -21,8 +47,35 @@ class Settings(BaseSettings):
 
     DEBUG: bool = True
     DB_SERVICE: PostgresDsn
+    # Flushes and maintenance get their own pools, so a long retention cannot hold connections of the flusher
+    DB_POOLS: dict[DBLane, PoolConfigs] = {
+        DBLane.DEFAULT: PoolConfigs(min_size=1, max_size=4, statement_timeout=5),
+        DBLane.WRITE: PoolConfigs(min_size=1, max_size=4, statement_timeout=60),
+        DBLane.MAINTENANCE: PoolConfigs(min_size=1, max_size=2),
+        # Cursor of an export is held while its client reads, stalled clients are cut off by the idle timeout
+        DBLane.EXPORT: PoolConfigs(min_size=0, max_size=2, statement_timeout=30, idle_timeout=30),
+    }
     APP_PORT: int = Field(9001, validation_alias="QUOTE_CONSUMER_APP_PORT")
     FLUSH_TO_DB_PERIOD: int = 30
+    # "fast" extracts only needed trade fields, "strict" validates whole payload with pydantic (for debugging)
+    TRADES_DECODER: Literal["fast", "strict"] = "fast"
+    SHARDS: int = Field(1, ge=1)  # Ingestion processes, tickers are split between them by hash
+    SHARDS_SOCKET_DIR: str = "/tmp"  # noqa: S108 Unix sockets API process uses to reach the shards
+    # Directory of the shared memory table with latest candles for services on the same host. Disabled if not set
+    CANDLES_TABLE_DIR: str | None = None
+    # Directory of the local buffer snapshot, restart restores buffer and not flushed candles from it. Disabled if not set
+    BUFFER_SNAPSHOT_DIR: str | None = None
+    # Standby connection next to every exchange connection, trades of both are deduplicated by trade id of the exchange
+    TRADES_REDUNDANT_CONNECTIONS: bool = False
+    # Directory raw frames of the exchange connections are recorded into with receive time. Disabled if not set
+    TRADES_RECORD_DIR: str | None = None
+    TRADES_RECORD_FILE_SIZE: int = 256 * 1024 * 1024  # Recording file is rotated after this number of uncompressed bytes
+    TRADES_RECORD_MAX_FILES: int = 100  # The oldest recording files of the process are removed above
+    # Directory of the recording replayed instead of connecting to the exchanges. Disabled if not set
+    TRADES_REPLAY_DIR: str | None = None
+    TRADES_REPLAY_SPEED: float = Field(0, ge=0)  # 1 replays at recorded speed, 2 twice faster, 0 as fast as possible
+    CANDLES_FEED_PERIOD: float = 1.0  # Changed latest candles are pushed to feed subscribers at most once per second
+    CANDLES_FEED_MAX_PENDING: int = 10  # Subscriber is disconnected when it falls behind by this number of frames
     TRADES_TO_CANDLES_CONFIG: TradesToCandleProcessorConfigs = TradesToCandleProcessorConfigs()
 
 
@@ -0,0 +1,51 @@
+import asyncio
+
+from common.candles_table import CandlesTableWriter, table_path
+from db.repositories import DB
+from quote_consumer.buffer_snapshot import BufferSnapshot, snapshot_path
+from quote_consumer.candle_processor import TradesToCandleProcessor
+from quote_consumer.candle_store import LocalCandleStore
+from quote_consumer.core.settings import settings
+from quote_consumer.ws_connector.base import RTTradesProvider
+from quote_consumer.ws_connector.replay import ReplayRTTradesProvider
+
+
+class Ingestion:
+    """Trades ingestion and aggregation into candles of the process. Whole market or a single shard of it."""
+
+    _trds_to_cndl_pr: TradesToCandleProcessor
+
+    def __init__(self, shard: tuple[int, int] | None = None) -> None:
+        self._shard = shard
+
+    async def start(self) -> LocalCandleStore:
+        await DB.connect(dsn=str(settings.DB_SERVICE), pools=settings.DB_POOLS)
+        shard_index, shards = self._shard or (0, 1)
+        candles_table = None
+        if settings.CANDLES_TABLE_DIR is not None:
+            candles_table = CandlesTableWriter(table_path(settings.CANDLES_TABLE_DIR, shard_index), shards)
+        # Replay neither restores nor writes buffer of the real trades, its candles stay in memory
+        replay = settings.TRADES_REPLAY_DIR is not None
+        snapshot = None
+        if settings.BUFFER_SNAPSHOT_DIR is not None and not replay:
+            snapshot = BufferSnapshot(snapshot_path(settings.BUFFER_SNAPSHOT_DIR, shard_index))
+        # Only one process is responsible for DB retention
+        self._trds_to_cndl_pr = TradesToCandleProcessor(
+            RTTradesProvider.get_trade_queue(),
+            remove_old_candles=shard_index == 0,
+            candles_table=candles_table,
+            snapshot=snapshot,
+            replay=replay,
+        )
+        # Recorded trades are replayed instead of connecting to the exchanges
+        providers = [ReplayRTTradesProvider] if replay else None
+        # Buffer is loaded from DB while connections are being set up
+        await asyncio.gather(
+            RTTradesProvider.run(shard=self._shard, providers=providers), self._trds_to_cndl_pr.run()
+        )
+        return LocalCandleStore(self._trds_to_cndl_pr.buffers)
+
+    async def stop(self) -> None:
+        await RTTradesProvider.stop()
+        await self._trds_to_cndl_pr.stop()
+        await DB.disconnect()
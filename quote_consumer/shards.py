@@ -0,0 +1,329 @@
+import asyncio
+import multiprocessing
+import os
+import pickle
+import signal
+import struct
+import traceback
+from collections import defaultdict
+from collections.abc import Sequence
+from contextlib import suppress
+from itertools import count
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+
+from common.candle_columns import slice_columns
+from common.candles_table import CandleRow
+from common.metrics import REGISTRY, MetricFamily, with_labels
+from quote_consumer.candle_store import (
+    CandleLookup,
+    CandleRange,
+    CandleStore,
+    CandleStoreError,
+    CandleStoreUnavailableError,
+    LocalCandleStore,
+)
+from quote_consumer.core.settings import settings
+from quote_consumer.ingestion import Ingestion
+from schemas.types import Candle, Market, Ticker, Timeframe, Timestamp
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+
+# Candle store methods shard processes serve to the API process
+_RPC_METHODS = frozenset(
+    {"get_candle", "get_candles", "get_candle_range", "get_latest_rows", "get_markets", "get_stats", "get_metrics"}
+)
+_FRAME_HEADER = struct.Struct("!I")
+
+
+def shard_socket_path(index: int) -> Path:
+    return Path(settings.SHARDS_SOCKET_DIR) / f"quote_consumer_shard_{index}.sock"
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Any:
+    (size,) = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+    return pickle.loads(await reader.readexactly(size))  # noqa: S301 Only own processes can access the socket
+
+
+def _write_frame(writer: asyncio.StreamWriter, obj: Any) -> None:
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_FRAME_HEADER.pack(len(data)) + data)
+
+
+class ShardServer:
+    """Serves candle store of the shard process to the API process over unix socket"""
+
+    _server: asyncio.Server
+
+    def __init__(self, store: LocalCandleStore, path: Path) -> None:
+        self._store = store
+        self._path = path
+
+    async def start(self) -> None:
+        self._path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(self._handle, self._path)
+        self._path.chmod(0o600)
+
+    async def stop(self) -> None:
+        self._server.close()
+        self._server.close_clients()
+        await self._server.wait_closed()
+        self._path.unlink(missing_ok=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                req_id, method, args = await _read_frame(reader)
+                _write_frame(writer, (req_id, *await self._dispatch(method, args)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, args: tuple[Any, ...]) -> tuple[bool, Any]:
+        if method not in _RPC_METHODS:
+            return False, CandleStoreError(f"Unknown method {method}")
+        try:
+            return True, await getattr(self._store, method)(*args)
+        except CandleStoreError as ex:
+            return False, ex
+        except Exception as ex:
+            logger.error(traceback.format_exc())
+            return False, CandleStoreError(str(ex))
+
+
+class ShardClient:
+    """Multiplexes concurrent calls of the API process over single connection to the shard process"""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._writer: asyncio.StreamWriter | None = None
+        self._pending: dict[int, asyncio.Future[tuple[bool, Any]]] = {}
+        self._req_ids = count()
+        self._connect_lock = asyncio.Lock()
+        self._responses_reader: asyncio.Task[None] | None = None
+
+    async def call(self, method: str, *args: Any) -> Any:
+        writer = await self._get_writer()
+        req_id = next(self._req_ids)
+        self._pending[req_id] = response = asyncio.get_running_loop().create_future()
+        try:
+            _write_frame(writer, (req_id, method, args))
+            await writer.drain()
+        except ConnectionError as ex:
+            self._pending.pop(req_id, None)
+            raise CandleStoreUnavailableError from ex
+        ok, value = await response
+        if not ok:
+            raise value
+        return value
+
+    async def close(self) -> None:
+        if self._responses_reader is not None:
+            self._responses_reader.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    async def _get_writer(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._writer is None:
+                try:
+                    reader, self._writer = await asyncio.open_unix_connection(self._path)
+                except OSError as ex:
+                    raise CandleStoreUnavailableError from ex
+                self._responses_reader = asyncio.create_task(self._read_responses(reader))
+            return self._writer
+
+    async def _read_responses(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                req_id, ok, value = await _read_frame(reader)
+                if (response := self._pending.pop(req_id, None)) is not None and not response.done():
+                    response.set_result((ok, value))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning(f"Connection to shard {self._path} lost")
+        finally:
+            self._writer = None
+            for response in self._pending.values():
+                if not response.done():
+                    response.set_exception(CandleStoreUnavailableError())
+            self._pending.clear()
+
+
+class ShardedCandleStore(CandleStore):
+    """Routes requests to the shard process owning the ticker"""
+
+    def __init__(self, clients: list[ShardClient]) -> None:
+        self._clients = clients
+
+    async def get_candle(
+        self, ticker: Ticker, timestamp: Timestamp | None = None, timeframe: Timeframe = Timeframe.S1
+    ) -> Candle:
+        return await self._owner(ticker).call("get_candle", ticker, timestamp, timeframe)
+
+    async def get_candles(self, lookups: Sequence[CandleLookup]) -> list[Candle | CandleStoreError]:
+        """Single call per shard owning any of the tickers"""
+        shards = len(self._clients)
+        shard_indexes: dict[int, list[int]] = defaultdict(list)
+        for idx, lookup in enumerate(lookups):
+            shard_indexes[lookup.ticker.shard(shards)].append(idx)
+        calls = (
+            self._clients[shard].call("get_candles", [lookups[idx] for idx in indexes])
+            for shard, indexes in shard_indexes.items()
+        )
+        candles: list[Candle | CandleStoreError] = [CandleStoreUnavailableError()] * len(lookups)
+        for indexes, shard_candles in zip(
+            shard_indexes.values(), await asyncio.gather(*calls, return_exceptions=True), strict=True
+        ):
+            if isinstance(shard_candles, CandleStoreError):
+                continue
+            if isinstance(shard_candles, BaseException):
+                raise shard_candles
+            for idx, candle in zip(indexes, shard_candles, strict=True):
+                candles[idx] = candle
+        return candles
+
+    async def get_candle_range(
+        self, tickers: Sequence[Ticker], from_: int, till: int, timeframe: Timeframe = Timeframe.S1
+    ) -> CandleRange:
+        """
+        Single call per shard owning any of the tickers. Range is covered from the latest coverage of the shards,
+        not at all if any shard is not loaded yet or unavailable.
+        """
+        shards = len(self._clients)
+        shard_tickers: dict[int, list[Ticker]] = defaultdict(list)
+        for ticker in tickers:
+            shard_tickers[ticker.shard(shards)].append(ticker)
+        calls = (
+            self._clients[shard].call("get_candle_range", tickers_, from_, till, timeframe)
+            for shard, tickers_ in shard_tickers.items()
+        )
+        shard_ranges: list[CandleRange] = []
+        for shard_range in await asyncio.gather(*calls, return_exceptions=True):
+            if isinstance(shard_range, CandleStoreError):
+                return CandleRange(None, [])
+            if isinstance(shard_range, BaseException):
+                raise shard_range
+            shard_ranges.append(shard_range)
+        coverages = [shard_range.covered_from for shard_range in shard_ranges]
+        if not coverages or None in coverages:
+            return CandleRange(None, [])
+        covered_from = max(coverage for coverage in coverages if coverage is not None)
+
+        columns = []
+        for shard_range in shard_ranges:
+            for ticker, ticker_columns in shard_range.columns:
+                sliced = ticker_columns
+                if shard_range.covered_from != covered_from:
+                    sliced = slice_columns(ticker_columns, covered_from, till)
+                if len(sliced[0]):
+                    columns.append((ticker, sliced))
+        return CandleRange(covered_from, columns)
+
+    async def get_latest_rows(self) -> dict[Ticker, CandleRow]:
+        """Latest candles of available shards"""
+        rows: dict[Ticker, CandleRow] = {}
+        calls = (client.call("get_latest_rows") for client in self._clients)
+        for shard_rows in await asyncio.gather(*calls, return_exceptions=True):
+            if isinstance(shard_rows, CandleStoreError):
+                continue
+            if isinstance(shard_rows, BaseException):
+                raise shard_rows
+            rows.update(shard_rows)
+        return rows
+
+    async def get_markets(self) -> list[Market]:
+        """Every shard knows all markets, the first available one answers"""
+        for client in self._clients:
+            try:
+                return await client.call("get_markets")
+            except CandleStoreUnavailableError:
+                continue
+        raise CandleStoreUnavailableError
+
+    async def get_stats(self) -> dict[str, int]:
+        stats: dict[str, int] = {"shards_unavailable": 0}
+        calls = (client.call("get_stats") for client in self._clients)
+        for shard_stats in await asyncio.gather(*calls, return_exceptions=True):
+            if isinstance(shard_stats, BaseException):
+                stats["shards_unavailable"] += 1
+                continue
+            for name, value in shard_stats.items():
+                stats[name] = stats.get(name, 0) + value
+        return stats
+
+    async def get_metrics(self) -> list[MetricFamily]:
+        """Metrics of available shards labeled with the shard, then metrics of the API process"""
+        families: list[MetricFamily] = []
+        calls = (client.call("get_metrics") for client in self._clients)
+        for shard, shard_families in enumerate(await asyncio.gather(*calls, return_exceptions=True)):
+            if isinstance(shard_families, BaseException):
+                continue
+            families.extend(with_labels(shard_families, (("shard", str(shard)),)))
+        return families + REGISTRY.collect()
+
+    async def close(self) -> None:
+        for client in self._clients:
+            await client.close()
+
+    def _owner(self, ticker: Ticker) -> ShardClient:
+        return self._clients[ticker.shard(len(self._clients))]
+
+
+class ShardProcesses:
+    """Worker processes each ingesting disjoint subset of tickers"""
+
+    def __init__(self, shards: int) -> None:
+        self._shards = shards
+        self._processes: list[BaseProcess] = []
+        self._store: ShardedCandleStore | None = None
+
+    def start(self) -> ShardedCandleStore:
+        ctx = multiprocessing.get_context("spawn")
+        for index in range(self._shards):
+            process = ctx.Process(
+                target=run_shard, args=(index, self._shards), name=f"quote_consumer_shard_{index}", daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+            logger.info(f"Shard {index} started, pid: {process.pid}")
+        self._store = ShardedCandleStore([ShardClient(shard_socket_path(idx)) for idx in range(self._shards)])
+        return self._store
+
+    async def stop(self) -> None:
+        if self._store is not None:
+            await self._store.close()
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            await asyncio.to_thread(process.join)
+            logger.info(f"Shard {process.name} stopped, exit code: {process.exitcode}")
+
+
+def run_shard(index: int, shards: int) -> None:
+    """Entrypoint of the shard process"""
+    asyncio.run(_serve_shard(index, shards))
+
+
+async def _serve_shard(index: int, shards: int) -> None:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+    # Interrupt from terminal is handled by API process, it stops the shards
+    loop.add_signal_handler(signal.SIGINT, lambda: None)
+
+    logger.info(f"Starting shard {index}/{shards}, pid: {os.getpid()}")
+    ingestion = Ingestion(shard=(index, shards))
+    server = ShardServer(await ingestion.start(), shard_socket_path(index))
+    await server.start()
+
+    await stop_event.wait()
+    logger.info(f"Stopping shard {index}/{shards}")
+    with suppress(Exception):
+        await server.stop()
+    await ingestion.stop()
+
@@ -1,8 +1,10 @@
 from quote_consumer.ws_connector.base import RTTradesProvider
 from quote_consumer.ws_connector.binance import BinanceRTTradesProvider
+from quote_consumer.ws_connector.replay import ReplayRTTradesProvider
 
 __all__ = [
     "BinanceRTTradesProvider",
     "RTTradesProvider",
+    "ReplayRTTradesProvider",
 ]
 
@@ -1,7 +1,10 @@
 import asyncio
+import collections
 import traceback
-from asyncio import Queue
-from collections.abc import Iterable
+from asyncio import Queue, QueueFull
+from collections.abc import Callable, Iterable, Sequence
+from operator import itemgetter
+from pathlib import Path
 from typing import TYPE_CHECKING, Any, ClassVar, get_args
 
 import ujson
@@ -10,13 +13,127 @@ from pydantic import BaseModel, ValidationError
 from websockets import ClientConnection, ConnectionClosedError, ConnectionClosedOK
 from websockets.asyncio.client import connect
 
-from schemas.types import Trade
+from common.metrics import Counter, Gauge
+from quote_consumer.core.settings import settings
+from quote_consumer.ws_connector.recording import FrameRecorder
+from schemas.types import Market, RawTrade, Ticker, Trade
+
+TRADES_RECEIVED = Counter("trades_received", "Trades received by connection", ["connection"])
+TRADES_DROPPED = Counter("trades_dropped", "Trades dropped because trades queue is full")
+TRADES_DUPLICATE = Counter("trades_duplicate", "Trades already received on another connection of the provider")
+MESSAGES_UNDECODED = Counter("trade_messages_undecoded", "Messages failed to decode into trade", ["connection"])
+MESSAGES_CONTROL = Counter("trade_messages_control", "Subscription responses and other non trade messages", ["connection"])
+TRADES_QUEUE_BATCHES = Gauge("trades_queue_batches", "Batches of trades waiting for the candles processor")
+WS_CONNECTIONS = Gauge("ws_connections", "Open connections to the exchanges")
+_TRADE_TICKER = itemgetter(0)
 
 
 class BaseTradePayload(BaseModel):
     def to_trade(self) -> Trade:  # type: ignore
         """Transform provider trade into internal structure."""
 
+    def to_raw(self) -> RawTrade:
+        return self.to_trade().to_raw()
+
+    @classmethod
+    def decode(cls, msg: str | bytes) -> RawTrade | None:
+        """
+        Fast path: extract only needed fields of the trade message straight into RawTrade without validation.
+        Returns None for non trade messages. Providers without the fast path validate the whole message.
+        """
+        return cls.decode_strict(msg)
+
+    @classmethod
+    def decode_strict(cls, msg: str | bytes) -> RawTrade | None:
+        """Whole message validated with the model. Returns None for non trade messages."""
+        try:
+            return cls.model_validate_json(msg).to_raw()
+        except ValidationError:
+            return None
+
+    @classmethod
+    def is_control(cls, msg: str | bytes) -> bool:  # noqa: ARG003
+        """Message not decoded into trade is a subscription response or alike, not a decode failure"""
+        return False
+
+
+class TradesDeduplicator:
+    """
+    Passes trades received on several connections once, by trade id. Ids of a ticker are increasing, so only
+    a window of ids below the highest seen one is remembered, as a bitmask. Older ids are taken for duplicates.
+    """
+
+    def __init__(self, window: int) -> None:
+        self._window = window
+        self._mask = (1 << window) - 1
+        self._seen: dict[Ticker, tuple[int, int]] = {}  # Highest id, bit i is set if id `highest - i` was seen
+
+    def is_new(self, trade: RawTrade) -> bool:
+        ticker, a = trade.T, trade.a
+        if a < 0:
+            return True
+        if (seen := self._seen.get(ticker)) is None:
+            self._seen[ticker] = (a, 1)
+            return True
+        highest, bits = seen
+        if a > highest:
+            shift = a - highest
+            self._seen[ticker] = (a, ((bits << shift) & self._mask) | 1 if shift < self._window else 1)
+            return True
+        offset = highest - a
+        if offset >= self._window or bits >> offset & 1:
+            return False
+        self._seen[ticker] = (highest, bits | 1 << offset)
+        return True
+
+
+class TradesBatcher:
+    """
+    Collects trades of the connection and hands them over to the trades queue by batches,
+    once batch is full or after the max delay. Batches not fitting into the queue are dropped and counted.
+    """
+
+    dropped_trades: ClassVar[int] = 0
+    dropped_batches: ClassVar[int] = 0
+
+    def __init__(
+        self,
+        queue: Queue[list[RawTrade]],
+        batch_size: int,
+        max_delay: float,
+        connection: str,
+        ticker_trades: collections.Counter[Ticker],
+    ) -> None:
+        self._queue = queue
+        self._received = TRADES_RECEIVED.labels(connection)
+        self._ticker_trades = ticker_trades
+        self._batch_size = batch_size
+        self._max_delay = max_delay
+        self._batch: list[RawTrade] = []
+
+    def add(self, trade: RawTrade) -> None:
+        self._batch.append(trade)
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._received.inc(len(batch))
+        self._ticker_trades.update(map(_TRADE_TICKER, batch))
+        try:
+            self._queue.put_nowait(batch)
+        except QueueFull:
+            TradesBatcher.dropped_trades += len(batch)
+            TradesBatcher.dropped_batches += 1
+            TRADES_DROPPED.inc(len(batch))
+
+    async def periodic_flush(self) -> None:
+        while True:
+            await asyncio.sleep(self._max_delay)
+            self.flush()
+
 
 class RTTradesProvider[T: BaseTradePayload]:
     """Base class for Real Time Trades Provider"""
@@ -26,29 +143,73 @@ class RTTradesProvider[T: BaseTradePayload]:
         ws_url: ClassVar[str]
 
     __trade_providers__: ClassVar[list[type["RTTradesProvider"]]] = []
-    __trades_queue__: ClassVar[Queue[Trade]] = Queue(maxsize=1_000)
+    __trades_queue__: ClassVar[Queue[list[RawTrade]]] = Queue(
+        maxsize=settings.TRADES_TO_CANDLES_CONFIG.trades_queue_size
+    )
     __connections__: ClassVar[set[ClientConnection]] = set()
     __listeners__: ClassVar[list[asyncio.Task[None]]] = []
+    __shard__: ClassVar[tuple[int, int] | None] = None  # Index of the shard and number of shards
+    __markets__: ClassVar[dict[Ticker, Market]] = {}  # All markets of the providers, not only ingested by the shard
+    __recorder__: ClassVar[FrameRecorder | None] = None  # Records raw frames of the connections when enabled
 
-    def __init_subclass__(cls) -> None:
-        if getattr(cls, "ws_url", None) is None:
-            raise RuntimeError(f"{cls.__name__} must have ws_url defined.")
-
-        RTTradesProvider.__trade_providers__.append(cls)
+    def __init_subclass__(cls, *, register: bool = True) -> None:
+        """Registered providers are run by default, others only when passed to `run` explicitly"""
+        if register:
+            if getattr(cls, "ws_url", None) is None:
+                raise RuntimeError(f"{cls.__name__} must have ws_url defined.")
+            RTTradesProvider.__trade_providers__.append(cls)
         for org in cls.__orig_bases__:  #type: ignore
             cls.__payload_type__ = get_args(org)[0]
 
+    def __init__(self) -> None:
+        self._ticker_trades: collections.Counter[Ticker] = collections.Counter()  # Trades received per ticker
+        self._connections: dict[str, ClientConnection] = {}  # Subscribed connections of the provider by name
+        self._streams_lock = asyncio.Lock()
+        self._deduplicator: TradesDeduplicator | None = None  # Set by providers which can receive a trade twice
+
     @classmethod
-    def get_trade_queue(cls) -> Queue[Trade]:
+    def get_trade_queue(cls) -> Queue[list[RawTrade]]:
         return cls.__trades_queue__
 
     @classmethod
-    async def run(cls) -> None:
+    def get_stats(cls) -> dict[str, int]:
+        return {
+            "connections": len(cls.__connections__),
+            "trades_queue_batches": cls.__trades_queue__.qsize(),
+            "trades_queue_max_batches": cls.__trades_queue__.maxsize,
+            "dropped_trades": TradesBatcher.dropped_trades,
+            "dropped_batches": TradesBatcher.dropped_batches,
+        }
+
+    @classmethod
+    def get_markets(cls) -> list[Market]:
+        return list(cls.__markets__.values())
+
+    @classmethod
+    async def run(
+        cls, shard: tuple[int, int] | None = None, providers: Sequence[type["RTTradesProvider"]] | None = None
+    ) -> None:
+        RTTradesProvider.__shard__ = shard
+        if settings.TRADES_RECORD_DIR is not None:
+            RTTradesProvider.__recorder__ = recorder = FrameRecorder(
+                Path(settings.TRADES_RECORD_DIR),
+                f"trades_{shard[0] if shard else 0}",
+                settings.TRADES_RECORD_FILE_SIZE,
+                settings.TRADES_RECORD_MAX_FILES,
+            )
+            RTTradesProvider.__listeners__.append(asyncio.create_task(recorder.run()))
         async with asyncio.TaskGroup() as tg:
-            for trades_provider in cls.__trade_providers__:
+            for trades_provider in cls.__trade_providers__ if providers is None else providers:
                 logger.info(f"Starting to listen for trades of {trades_provider.__name__}")
                 tg.create_task(trades_provider().robust_listen())
 
+    def owns(self, ticker: Ticker) -> bool:
+        """Whether trades of the ticker are ingested by this process. All tickers unless running sharded."""
+        if (shard := self.__shard__) is None:
+            return True
+        index, shards = shard
+        return ticker.shard(shards) == index
+
     async def get_conn_sub_message(self) -> Iterable[tuple[list[dict[str, Any]], float | None]]:
         """
         Generate subscription messages.
@@ -57,11 +218,17 @@ class RTTradesProvider[T: BaseTradePayload]:
         return []
 
     async def robust_listen(self) -> None:
-        for sub_msgs, delay in await self.get_conn_sub_message():
-            listener = asyncio.create_task(self._connect_and_listen(sub_msgs, delay))
+        sub_msgs_per_conn = await self.get_conn_sub_message()
+        if (recorder := self.__recorder__) is not None:
+            await recorder.write_markets(self.get_markets())
+        for idx, (sub_msgs, delay) in enumerate(sub_msgs_per_conn):
+            listener = asyncio.create_task(self._connect_and_listen(sub_msgs, delay, self._connection_name(idx)))
             RTTradesProvider.__listeners__.append(listener)
             await asyncio.sleep(5 * (delay or 0.2))  # Add some delay between creating the connection from same IP
 
+    def _connection_name(self, idx: int) -> str:
+        return f"{type(self).__name__}:{idx}"
+
     @classmethod
     async def stop(cls) -> None:
         for listener in cls.__listeners__:
@@ -71,15 +238,24 @@ class RTTradesProvider[T: BaseTradePayload]:
             logger.info(f"Closed WS connection: {conn.id}")
             await conn.close()
 
+        if cls.__recorder__ is not None:
+            await cls.__recorder__.close()
+
     async def _connect_and_listen(
-        self, sub_msgs: list[dict[str, Any]], sub_msg_delay: float | None = None
+        self,
+        sub_msgs: list[dict[str, Any]],
+        sub_msg_delay: float | None = None,
+        connection: str = "",
+        url: Callable[[], str] | None = None,
     ) -> None:
+        """`url` builds URL of every connect instead of `ws_url`, e.g. with the current streams of the connection"""
         # NOTE: There is a build in exponential backoff
-        async for conn in connect(self.ws_url):
+        connector = connect(self.ws_url if url is None else url())
+        async for conn in connector:
             logger.info(f"WS connection: {conn.id}")
             RTTradesProvider.__connections__.add(conn)
             try:
-                await self._listen(conn, sub_msgs, sub_msg_delay)
+                await self._listen(conn, sub_msgs, sub_msg_delay, connection)
             except ConnectionClosedOK:
                 logger.info("Controlled close of WS connection")
                 break
@@ -91,24 +267,64 @@ class RTTradesProvider[T: BaseTradePayload]:
                 break
 
             RTTradesProvider.__connections__.remove(conn)
+            if url is not None:
+                connector.uri = url()
 
     async def _listen(
         self,
         conn: ClientConnection,
         sub_message: list[dict[str,  Any]],
-        sub_msg_delay: float | None = None
+        sub_msg_delay: float | None = None,
+        connection: str = "",
     ) -> None:
-        for sm in sub_message:
-            await conn.send(ujson.dumps(sm))
-            # If provider has restriction on rate of subscription message. Ex: Binance has 5 msg/sec
-            if sub_msg_delay:
-                await asyncio.sleep(sub_msg_delay)
-
-        # Loop will finish in case of server disconnect
-        async for msg in conn:
-            try:
-                payload: T = self.__payload_type__.model_validate_json(msg)
-            except ValidationError:
-                logger.debug(f"Non trade message: {msg.decode() if isinstance(msg, bytes) else msg}")
-                continue
-            await self.__trades_queue__.put(payload.to_trade())
+        # Streams of the connections are changed live under the same lock, once the connection is subscribed
+        async with self._streams_lock:
+            for sm in sub_message:
+                await conn.send(ujson.dumps(sm))
+                # If provider has restriction on rate of subscription message. Ex: Binance has 5 msg/sec
+                if sub_msg_delay:
+                    await asyncio.sleep(sub_msg_delay)
+            self._connections[connection] = conn
+
+        decode = self._get_decoder()
+        configs = settings.TRADES_TO_CANDLES_CONFIG
+        batcher = TradesBatcher(
+            self.__trades_queue__,
+            configs.trades_batch_size,
+            configs.trades_batch_max_delay,
+            connection,
+            self._ticker_trades,
+        )
+        undecoded = MESSAGES_UNDECODED.labels(connection)
+        control = MESSAGES_CONTROL.labels(connection)
+        is_control = self.__payload_type__.is_control
+        recorder = self.__recorder__
+        deduplicator = self._deduplicator
+        duplicates = TRADES_DUPLICATE.labels()
+        batch_flusher = asyncio.create_task(batcher.periodic_flush())
+        try:
+            # Loop will finish in case of server disconnect
+            async for msg in conn:
+                if recorder is not None:
+                    recorder.add(connection, msg)
+                if (trade := decode(msg)) is None:
+                    (control if is_control(msg) else undecoded).inc()
+                    logger.debug(f"Non trade message: {msg.decode() if isinstance(msg, bytes) else msg}")
+                    continue
+                if deduplicator is not None and not deduplicator.is_new(trade):
+                    duplicates.inc()
+                    continue
+                batcher.add(trade)
+        finally:
+            self._connections.pop(connection, None)
+            batch_flusher.cancel()
+            batcher.flush()
+
+    def _get_decoder(self) -> Callable[[str | bytes], RawTrade | None]:
+        if settings.TRADES_DECODER == "strict":
+            return self.__payload_type__.decode_strict
+        return self.__payload_type__.decode
+
+
+TRADES_QUEUE_BATCHES.set_function(lambda: [((), RTTradesProvider.get_trade_queue().qsize())])
+WS_CONNECTIONS.set_function(lambda: [((), len(RTTradesProvider.__connections__))])
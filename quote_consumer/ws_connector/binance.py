@@ -1,16 +1,27 @@
+import asyncio
+from collections import defaultdict
 from collections.abc import Iterable
 from decimal import Decimal
 from enum import StrEnum
+from functools import cache
 from itertools import batched
-from typing import ClassVar, TypedDict
+from math import ceil
+from typing import Any, ClassVar, TypedDict
 from uuid import uuid4
 
 import ujson
 from aiosonic.client import HTTPClient
 from loguru import logger
+from pydantic import model_validator
+from websockets import ConnectionClosed
 
-from quote_consumer.ws_connector.base import BaseTradePayload, RTTradesProvider
-from schemas.types import Symbol, Ticker, Timestamp, Trade
+from common.metrics import Counter
+from quote_consumer.core.settings import settings
+from quote_consumer.ws_connector.base import BaseTradePayload, RTTradesProvider, TradesDeduplicator
+from schemas.types import Market, RawTrade, Symbol, Ticker, Timestamp, Trade
+
+STREAMS_MOVED = Counter("ws_streams_moved", "Streams moved between connections to balance their trade rates")
+SYMBOLS_CHANGED = Counter("ws_symbols_changed", "Symbols subscribed or unsubscribed after listing changes", ["change"])
 
 
 class BinanceMsgType(StrEnum):
@@ -37,6 +48,14 @@ class BinanceTradePayload(BaseTradePayload):
     m: bool    # Is the buyer the market maker?
     M: bool    # Ignore
 
+    @model_validator(mode="before")
+    @classmethod
+    def _unwrap_combined_stream(cls, data: Any) -> Any:
+        """Frames of combined streams wrap the payload: {"stream": "<symbol>@aggTrade", "data": {...}}"""
+        if isinstance(data, dict) and "stream" in data:
+            return data.get("data")
+        return data
+
     def to_trade(self) -> Trade:
         return Trade(
             t=Timestamp(self.T),
@@ -45,30 +64,268 @@ class BinanceTradePayload(BaseTradePayload):
             v=self.q
         )
 
+    def to_raw(self) -> RawTrade:
+        return super().to_raw()._replace(a=self.a)
+
+    @classmethod
+    def decode(cls, msg: str | bytes) -> RawTrade | None:
+        # Cheap rejection of subscription responses and other non trade frames before parsing
+        if isinstance(msg, bytes):
+            if b'"aggTrade"' not in msg:
+                return None
+        elif '"aggTrade"' not in msg:
+            return None
+        try:
+            data = ujson.loads(msg)
+            if "stream" in data:  # Frame of combined streams
+                data = data["data"]
+            return RawTrade(_binance_ticker(data["s"]), data["T"], float(data["p"]), float(data["q"]), data["a"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @classmethod
+    def is_control(cls, msg: str | bytes) -> bool:
+        # Responses to SUBSCRIBE/UNSUBSCRIBE, errors have "error" instead
+        return b'"result"' in msg if isinstance(msg, bytes) else '"result"' in msg
+
+
+@cache
+def _binance_ticker(symbol: Symbol) -> Ticker:
+    return Ticker.build(symbol, "BINANCE")
+
 
 class BinanceRTTradesProvider(RTTradesProvider[BinanceTradePayload]):
     ws_url: ClassVar[str] = "wss://stream.binance.com:9443/ws"
+    # Streams are passed in the URL, standby connections are subscribed as soon as they are open
+    combined_ws_url: ClassVar[str] = "wss://stream.binance.com:9443/stream"
 
     # NOTE: According to binance docs N_STREAM is 1024 but it does not broadcast trades
     N_STREAMS: ClassVar[int] = 1024  # Maximum number of stream per connection
     MAX_SUBS_PER_MESSAGE: ClassVar[int] = 200
     SUB_DELAY: ClassVar[float] = 0.3  # Subscriptions messages sending rate
+    STREAMS_FILL: ClassVar[float] = 0.9  # Connections get 90% of N_STREAMS, the rest is room for moved streams
+    REBALANCE_PERIOD: ClassVar[float] = 60  # Trade rates of the streams are measured over this number of seconds
+    REBALANCE_TOLERANCE: ClassVar[float] = 0.2  # Busiest and idlest connections may differ by 20% of the mean rate
+    REBALANCE_MAX_MOVES: ClassVar[int] = 50  # Streams moved per rebalancing
+    SYMBOLS_REFRESH_PERIOD: ClassVar[float] = 300  # Listed, delisted and halted symbols are picked up every 5 minutes
+    DEDUP_WINDOW: ClassVar[int] = 1024  # Trade ids per symbol remembered to drop trades received twice
     exchange_info_url: ClassVar[str] = "https://api.binance.com/api/v3/exchangeInfo"
     http_client: ClassVar[HTTPClient] = HTTPClient()
 
+    def __init__(self) -> None:
+        super().__init__()
+        self._conn_symbols: list[set[Symbol]] = []
+        # Reconnects subscribe with these messages, they are kept in sync with the streams moved live
+        self._conn_sub_messages: list[list[BinanceStreamSubMsg]] = []
+        self._standbys: dict[int, asyncio.Task[None]] = {}  # Listeners of the standby connections by connection index
+        # Always on: moved streams are delivered by both connections for a round trip, standby ones all the time
+        self._deduplicator = TradesDeduplicator(self.DEDUP_WINDOW)
+
     async def get_conn_sub_message(self) -> Iterable[tuple[list[BinanceStreamSubMsg], float | None]]:  # type: ignore
         logger.info("Fetching all available symbols...")
-        resp = await self.http_client.get(self.exchange_info_url)
-        symbols = sorted(r["symbol"] for r in (await resp.json(json_decoder=ujson.loads))["symbols"])
+        symbols = sorted(await self._fetch_symbols())
         logger.info(f"Symbols {len(symbols)} fetched.")
-        sub_messages_per_conn: list[tuple[list[BinanceStreamSubMsg], float | None]] = []
-        for batch_per_connection in batched(symbols, self.N_STREAMS):
-            sub_messages_of_conn: list[BinanceStreamSubMsg] = []
-            for batch_per_subscription in batched(batch_per_connection, self.MAX_SUBS_PER_MESSAGE):
-                sub_msg_id = str(uuid4())
-                params = [f"{str(sym).lower()}@aggTrade" for sym in batch_per_subscription]
-                sub_messages_of_conn.append(
-                    BinanceStreamSubMsg(method=BinanceMsgType.subscribe, params=params, id=sub_msg_id)
-                )
-            sub_messages_per_conn.append((sub_messages_of_conn, self.SUB_DELAY))
-        return sub_messages_per_conn
+        # Round robin, neighbours in alphabetical order are often listings of the same asset with alike activity
+        conns = ceil(len(symbols) / int(self.N_STREAMS * self.STREAMS_FILL))
+        self._conn_symbols = [set(symbols[idx::conns]) for idx in range(conns)]
+        self._conn_sub_messages = [
+            self._sub_messages(BinanceMsgType.subscribe, conn_symbols) for conn_symbols in self._conn_symbols
+        ]
+        return [(sub_messages_of_conn, self.SUB_DELAY) for sub_messages_of_conn in self._conn_sub_messages]
+
+    async def robust_listen(self) -> None:
+        await super().robust_listen()
+        for idx in range(len(self._conn_symbols)):
+            await self._sync_standby(idx)
+        RTTradesProvider.__listeners__.extend([
+            asyncio.create_task(self._periodic_rebalancer()),
+            asyncio.create_task(self._periodic_symbols_refresher()),
+        ])
+
+    async def _fetch_symbols(self) -> set[Symbol]:
+        """Trading symbols ingested by the process. Markets are replaced by all trading ones of the exchange."""
+        resp = await self.http_client.get(self.exchange_info_url)
+        exchange_symbols = [
+            r for r in (await resp.json(json_decoder=ujson.loads))["symbols"] if r["status"] == "TRADING"
+        ]
+        markets = {
+            (ticker := _binance_ticker(r["symbol"])): Market(T=ticker, base=r["baseAsset"], quote=r["quoteAsset"])
+            for r in exchange_symbols
+        }
+        for ticker in [t for t in RTTradesProvider.__markets__ if t.exchange == "BINANCE" and t not in markets]:
+            del RTTradesProvider.__markets__[ticker]
+        RTTradesProvider.__markets__.update(markets)
+        return {r["symbol"] for r in exchange_symbols if self.owns(_binance_ticker(r["symbol"]))}
+
+    async def _periodic_symbols_refresher(self) -> None:
+        while True:
+            await asyncio.sleep(self.SYMBOLS_REFRESH_PERIOD)
+            try:
+                symbols = await self._fetch_symbols()
+            except Exception as ex:
+                logger.error(f"Cannot refresh symbols: {ex}")
+                continue
+            async with self._streams_lock:
+                await self._update_symbols(symbols)
+            if (recorder := self.__recorder__) is not None:
+                await recorder.write_markets(self.get_markets())
+
+    async def _update_symbols(self, symbols: set[Symbol]) -> None:
+        """
+        Streams of gone symbols are unsubscribed, new ones are subscribed on the connections with the fewest streams.
+        Connections are opened only when the others are filled.
+        """
+        current: set[Symbol] = set().union(*self._conn_symbols)
+        removed, added = current - symbols, sorted(symbols - current)
+        for idx, conn_symbols in enumerate(self._conn_symbols):
+            if gone := conn_symbols & removed:
+                conn_symbols.difference_update(gone)
+                self._update_sub_messages(idx)
+                await self._send_sub_messages(idx, BinanceMsgType.unsubscribe, gone)
+        capacity = int(self.N_STREAMS * self.STREAMS_FILL)
+        placed: dict[int, list[Symbol]] = defaultdict(list)
+        opened: list[int] = []
+        for symbol in added:
+            idx = min(range(len(self._conn_symbols)), key=lambda i: len(self._conn_symbols[i]), default=-1)
+            if idx < 0 or len(self._conn_symbols[idx]) >= capacity:
+                idx = len(self._conn_symbols)
+                self._conn_symbols.append(set())
+                self._conn_sub_messages.append([])
+                opened.append(idx)
+            self._conn_symbols[idx].add(symbol)
+            placed[idx].append(symbol)
+        for idx, conn_added in placed.items():
+            self._update_sub_messages(idx)
+            if idx not in opened:
+                await self._send_sub_messages(idx, BinanceMsgType.subscribe, conn_added)
+        for idx in opened:
+            listener = asyncio.create_task(self._connect_and_listen(
+                self._conn_sub_messages[idx], self.SUB_DELAY, self._connection_name(idx)  # type: ignore[arg-type]
+            ))
+            RTTradesProvider.__listeners__.append(listener)
+            await self._sync_standby(idx)
+        SYMBOLS_CHANGED.labels("added").inc(len(added))
+        SYMBOLS_CHANGED.labels("removed").inc(len(removed))
+        if added or removed:
+            logger.info(
+                f"Symbols refreshed, added: {', '.join(added) or '-'}, removed: {', '.join(sorted(removed)) or '-'}. "
+                f"New connections: {len(opened)}"
+            )
+
+    async def _periodic_rebalancer(self) -> None:
+        while True:
+            await asyncio.sleep(self.REBALANCE_PERIOD)
+            rates = {ticker.symbol: count / self.REBALANCE_PERIOD for ticker, count in self._ticker_trades.items()}
+            self._ticker_trades.clear()
+            async with self._streams_lock:
+                if moves := self._plan_moves(rates):
+                    await self._move_streams(moves)
+
+    def _plan_moves(self, rates: dict[Symbol, float]) -> dict[tuple[int, int], list[Symbol]]:
+        """
+        Greedy: stream of the busiest connection is moved to the idlest one, until their trade rates are within
+        the tolerance. Only subscribed connections take part, reconnecting ones keep their streams.
+        """
+        live = [idx for idx in range(len(self._conn_symbols)) if self._connection_name(idx) in self._connections]
+        if len(live) < 2:  # noqa: PLR2004
+            return {}
+        symbols = {idx: set(self._conn_symbols[idx]) for idx in live}
+        loads = {idx: sum(rates.get(symbol, 0.0) for symbol in symbols[idx]) for idx in live}
+        tolerance = sum(loads.values()) / len(loads) * self.REBALANCE_TOLERANCE
+        moves: dict[tuple[int, int], list[Symbol]] = defaultdict(list)
+        for _ in range(self.REBALANCE_MAX_MOVES):
+            src, dst = max(loads, key=loads.__getitem__), min(loads, key=loads.__getitem__)
+            gap = loads[src] - loads[dst]
+            if gap <= tolerance or len(symbols[dst]) >= self.N_STREAMS:
+                break
+            # Stream closest to the half of the gap levels the pair the most, streams above the gap swap their roles
+            candidates = [symbol for symbol in symbols[src] if 0 < rates.get(symbol, 0.0) < gap]
+            if not candidates:
+                break
+            symbol = min(candidates, key=lambda sym: abs(rates[sym] - gap / 2))
+            symbols[src].remove(symbol)
+            symbols[dst].add(symbol)
+            loads[src] -= rates[symbol]
+            loads[dst] += rates[symbol]
+            moves[src, dst].append(symbol)
+        return moves
+
+    async def _move_streams(self, moves: dict[tuple[int, int], list[Symbol]]) -> None:
+        for (src, dst), symbols in moves.items():
+            # Reconnects already subscribe the new streams of the connections, even if sending below fails
+            self._conn_symbols[src].difference_update(symbols)
+            self._conn_symbols[dst].update(symbols)
+            self._update_sub_messages(src)
+            self._update_sub_messages(dst)
+            # Subscribed on the new connection first: trades of the moved streams may come twice for a round trip,
+            # instead of being lost. Deduplicator drops the second ones
+            await self._send_sub_messages(dst, BinanceMsgType.subscribe, symbols)
+            await self._send_sub_messages(src, BinanceMsgType.unsubscribe, symbols)
+            STREAMS_MOVED.inc(len(symbols))
+            logger.info(f"Moved {len(symbols)} streams from connection {src} to {dst}: {', '.join(sorted(symbols))}")
+
+    async def _sync_standby(self, idx: int) -> None:
+        """
+        Standby connection follows the streams of the connection: it is parked while there are none,
+        combined streams URL without streams is rejected, and started again once streams are assigned
+        """
+        if not settings.TRADES_REDUNDANT_CONNECTIONS:
+            return
+        standby = self._standbys.get(idx)
+        running = standby is not None and not standby.done()
+        if self._conn_symbols[idx] and not running:
+            self._standbys[idx] = self._listen_standby(idx)
+        elif standby is not None and running and not self._conn_symbols[idx]:
+            name = self._standby_name(idx)
+            conn = self._connections.get(name)
+            standby.cancel()
+            await asyncio.wait([standby])
+            if conn is not None:
+                RTTradesProvider.__connections__.discard(conn)
+                await conn.close()
+            logger.info(f"Standby {name} parked, its connection has no streams")
+
+    def _listen_standby(self, idx: int) -> asyncio.Task[None]:
+        """
+        Second connection with the same streams, trades are taken from whichever connection delivers them first,
+        so reconnect of either of them loses nothing
+        """
+        def url() -> str:
+            streams = "/".join(f"{str(sym).lower()}@aggTrade" for sym in sorted(self._conn_symbols[idx]))
+            return f"{self.combined_ws_url}?streams={streams}"
+
+        listener = asyncio.create_task(self._connect_and_listen([], None, self._standby_name(idx), url))
+        RTTradesProvider.__listeners__.append(listener)
+        return listener
+
+    def _standby_name(self, idx: int) -> str:
+        return f"{self._connection_name(idx)}:standby"
+
+    def _update_sub_messages(self, idx: int) -> None:
+        """Sub messages are updated in place, listener of the connection subscribes with them on reconnect"""
+        self._conn_sub_messages[idx][:] = self._sub_messages(BinanceMsgType.subscribe, self._conn_symbols[idx])
+
+    async def _send_sub_messages(self, idx: int, method: BinanceMsgType, symbols: Iterable[Symbol]) -> None:
+        """
+        Sent to the connection and its standby. Not subscribed ones are skipped, they get the updated streams on connect.
+        Standby is then parked or started by the streams left on the connection.
+        """
+        sub_messages = self._sub_messages(method, symbols)
+        for name in (self._connection_name(idx), self._standby_name(idx)):
+            if (conn := self._connections.get(name)) is None:
+                continue
+            try:
+                for sub_msg in sub_messages:
+                    await conn.send(ujson.dumps(sub_msg))
+                    await asyncio.sleep(self.SUB_DELAY)
+            except ConnectionClosed:
+                logger.info(f"Connection {name} closed while changing its streams")
+        await self._sync_standby(idx)
+
+    def _sub_messages(self, method: BinanceMsgType, symbols: Iterable[Symbol]) -> list[BinanceStreamSubMsg]:
+        return [
+            BinanceStreamSubMsg(
+                method=method, params=[f"{str(sym).lower()}@aggTrade" for sym in batch], id=str(uuid4())
+            )
+            for batch in batched(sorted(symbols), self.MAX_SUBS_PER_MESSAGE)
+        ]
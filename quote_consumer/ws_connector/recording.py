@@ -0,0 +1,146 @@
+import asyncio
+import gzip
+import heapq
+import os
+import threading
+import time
+import traceback
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from operator import itemgetter
+from pathlib import Path
+from typing import NamedTuple
+
+import ujson
+from loguru import logger
+
+from common.metrics import Counter
+from schemas.types import Market
+
+# Recording of raw frames of exchange connections: gzip files of `<received at, us>\t<connection>\t<frame>\n` lines,
+# rotated by size. Markets of the providers are kept next to them, so replay serves them without the exchanges.
+FRAMES_RECORDED = Counter("trade_frames_recorded", "Raw frames written into the recording")
+FRAMES_RECORD_DROPPED = Counter("trade_frames_record_dropped", "Raw frames not recorded, writer fell behind or failed")
+_SUFFIX = ".tsv.gz"
+_FILE_TIME_GLOB = "[0-9]" * 8 + "T*"  # Start of the file time, `trades_1_` files are told apart from `trades_10_` ones
+_MARKETS_FILE = "markets.json"
+_WRITE_PERIOD = 1.0  # Queued frames are handed over to the writer thread every second
+_MAX_PENDING = 1_000_000  # Frames are dropped when the writer falls behind by this number of frames
+_COMPRESS_LEVEL = 1  # Frames compress well already at the fastest level
+
+
+class RecordedFrame(NamedTuple):
+    received_at: int  # in microseconds
+    connection: str
+    frame: str
+
+
+class FrameRecorder:
+    """
+    Frames are only queued on the read path, compression and writes run in a thread.
+    File is rotated after `file_size` uncompressed bytes, the oldest files above `max_files` are removed.
+    """
+
+    def __init__(self, directory: Path, name: str, file_size: int, max_files: int) -> None:
+        self._directory = directory
+        self._name = name
+        self._file_size = file_size
+        self._max_files = max_files
+        self._pending: list[str] = []
+        self._file: gzip.GzipFile | None = None
+        self._written = 0
+        self._lock = threading.Lock()  # Write of the cancelled writer task can still run in its thread
+        self._recorded = FRAMES_RECORDED.labels()
+        self._dropped = FRAMES_RECORD_DROPPED.labels()
+
+    def add(self, connection: str, frame: str | bytes) -> None:
+        if len(self._pending) >= _MAX_PENDING:
+            self._dropped.inc()
+            return
+        if isinstance(frame, bytes):
+            frame = frame.decode()
+        if "\n" in frame:  # Only whitespace between JSON tokens, raw newlines are invalid inside strings
+            frame = frame.replace("\n", " ")
+        self._pending.append(f"{time.time_ns() // 1000}\t{connection}\t{frame}\n")
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(_WRITE_PERIOD)
+            await self._write_pending()
+
+    async def close(self) -> None:
+        await self._write_pending()
+        await asyncio.to_thread(self._close_file)
+
+    async def write_markets(self, markets: list[Market]) -> None:
+        data = ujson.dumps([market.model_dump() for market in markets]).encode()
+        try:
+            await asyncio.to_thread(self._replace, self._directory / _MARKETS_FILE, data)
+        except OSError:
+            logger.error("Cannot write markets of the recording.")
+            logger.error(traceback.format_exc())
+
+    async def _write_pending(self) -> None:
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._write, "".join(lines).encode())
+        except OSError:
+            self._dropped.inc(len(lines))
+            logger.error("Cannot write trades recording.")
+            logger.error(traceback.format_exc())
+            return
+        self._recorded.inc(len(lines))
+
+    def _write(self, data: bytes) -> None:
+        with self._lock:
+            if (file := self._file) is None:
+                self._directory.mkdir(parents=True, exist_ok=True)
+                path = self._directory / f"{self._name}_{datetime.now(tz=UTC):%Y%m%dT%H%M%S%f}{_SUFFIX}"
+                self._file = file = gzip.GzipFile(path, "wb", compresslevel=_COMPRESS_LEVEL)
+                self._written = 0
+                logger.info(f"Recording trades into {path}")
+            file.write(data)
+            self._written += len(data)
+            if self._written >= self._file_size:
+                file.close()
+                self._file = None
+                for path in sorted(self._directory.glob(f"{self._name}_{_FILE_TIME_GLOB}{_SUFFIX}"))[:-self._max_files]:
+                    path.unlink(missing_ok=True)
+
+    def _close_file(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _replace(self, path: Path, data: bytes) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")  # Shard processes share the directory
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+
+def read_recording(directory: Path) -> Iterator[RecordedFrame]:
+    """Frames of all recording files in the directory, merged in receive time order"""
+    return heapq.merge(*(_read_file(path) for path in sorted(directory.glob(f"*{_SUFFIX}"))), key=itemgetter(0))
+
+
+def read_markets(directory: Path) -> list[Market]:
+    try:
+        data = (directory / _MARKETS_FILE).read_bytes()
+    except FileNotFoundError:
+        return []
+    return [Market.model_validate(item) for item in ujson.loads(data)]
+
+
+def _read_file(path: Path) -> Iterator[RecordedFrame]:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                received_at, connection, frame = line.rstrip("\n").split("\t", 2)
+                yield RecordedFrame(int(received_at), connection, frame)
+    except (EOFError, gzip.BadGzipFile):
+        # File of the process which has not closed it, e.g. crashed
+        logger.warning(f"Recording {path} is truncated, replayed up to the damaged part")
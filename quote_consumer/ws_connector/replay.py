@@ -0,0 +1,101 @@
+import asyncio
+from collections.abc import Callable
+from itertools import islice
+from pathlib import Path
+from time import monotonic
+
+from loguru import logger
+
+from common.metrics import CounterChild
+from quote_consumer.core.settings import settings
+from quote_consumer.ws_connector.base import (
+    MESSAGES_CONTROL,
+    MESSAGES_UNDECODED,
+    TRADES_DUPLICATE,
+    TRADES_RECEIVED,
+    BaseTradePayload,
+    RTTradesProvider,
+    TradesDeduplicator,
+)
+from quote_consumer.ws_connector.recording import read_markets, read_recording
+from schemas.types import RawTrade
+
+_READ_CHUNK = 5_000  # Frames read from the files per thread call
+_MIN_SLEEP = 0.001  # At recorded speed frames closer than this are handed over without waiting
+_DEDUP_WINDOW = 1024  # Recordings of redundant connections hold trades twice, ids per ticker remembered to drop them
+
+
+class ReplayRTTradesProvider(RTTradesProvider[BaseTradePayload], register=False):
+    """
+    Feeds recorded frames through the decoders of the providers which received them, without network.
+    Batches wait for room in the trades queue instead of being dropped, so replay of the same recording
+    produces the same candles.
+    """
+
+    def __init__(self, directory: Path | None = None, speed: float | None = None) -> None:
+        super().__init__()
+        self._directory = directory or Path(settings.TRADES_REPLAY_DIR or ".")
+        self._speed = settings.TRADES_REPLAY_SPEED if speed is None else speed
+
+    async def robust_listen(self) -> None:
+        for market in await asyncio.to_thread(read_markets, self._directory):
+            RTTradesProvider.__markets__[market.T] = market
+        RTTradesProvider.__listeners__.append(asyncio.create_task(self._replay()))
+
+    async def _replay(self) -> None:
+        logger.info(f"Replaying trades of {self._directory} at speed {self._speed or 'max'}")
+        providers = {provider.__name__: provider for provider in self.__trade_providers__}
+        decoders: dict[str, tuple[Callable[[str | bytes], RawTrade | None], Callable[[str | bytes], bool]]] = {}
+        received = TRADES_RECEIVED.labels(type(self).__name__)
+        undecoded = MESSAGES_UNDECODED.labels(type(self).__name__)
+        control = MESSAGES_CONTROL.labels(type(self).__name__)
+        duplicates = TRADES_DUPLICATE.labels()
+        deduplicator = TradesDeduplicator(_DEDUP_WINDOW)
+        batch_size = settings.TRADES_TO_CANDLES_CONFIG.trades_batch_size
+        frames = read_recording(self._directory)
+        batch: list[RawTrade] = []
+        replayed, t_start, first_received_at = 0, monotonic(), None
+        while chunk := await asyncio.to_thread(list, islice(frames, _READ_CHUNK)):
+            for received_at, connection, frame in chunk:
+                if self._speed:
+                    if first_received_at is None:
+                        first_received_at = received_at
+                    delay = t_start + (received_at - first_received_at) / 1e6 / self._speed - monotonic()
+                    if delay > _MIN_SLEEP:
+                        await self._hand_over(batch, received)
+                        batch = []
+                        await asyncio.sleep(delay)
+                if (decoder := decoders.get(connection)) is None:
+                    decoders[connection] = decoder = self._recorded_decoder(providers, connection)
+                decode, is_control = decoder
+                if (trade := decode(frame)) is None:
+                    (control if is_control(frame) else undecoded).inc()
+                    continue
+                if not deduplicator.is_new(trade):
+                    duplicates.inc()
+                    continue
+                if self.owns(trade.T):
+                    batch.append(trade)
+                    if len(batch) >= batch_size:
+                        await self._hand_over(batch, received)
+                        batch = []
+            replayed += len(chunk)
+        await self._hand_over(batch, received)
+        logger.info(f"Replay of {self._directory} finished: {replayed} frames in {monotonic() - t_start:.1f}s")
+
+    def _recorded_decoder(
+        self, providers: dict[str, type[RTTradesProvider]], connection: str
+    ) -> tuple[Callable[[str | bytes], RawTrade | None], Callable[[str | bytes], bool]]:
+        """
+        Decoder and control messages check of the provider of the connection,
+        labels of the connections start with the provider name
+        """
+        if (provider := providers.get(connection.partition(":")[0])) is None:
+            logger.warning(f"No provider for frames of the recorded connection {connection}, skipped")
+            return (lambda _msg: None), (lambda _msg: False)
+        return provider()._get_decoder(), provider.__payload_type__.is_control  # noqa: SLF001
+
+    async def _hand_over(self, batch: list[RawTrade], received: CounterChild) -> None:
+        if batch:
+            received.inc(len(batch))
+            await self.__trades_queue__.put(batch)
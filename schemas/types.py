@@ -1,7 +1,9 @@
 
 from datetime import UTC, datetime
 from decimal import Decimal
-from typing import Any, Self
+from enum import StrEnum
+from typing import Any, NamedTuple, Self
+from zlib import crc32
 
 from pydantic import BaseModel, GetCoreSchemaHandler, GetJsonSchemaHandler
 from pydantic.json_schema import JsonSchemaValue
@@ -9,6 +11,9 @@ from pydantic_core import core_schema
 
 type Symbol = str
 
+FLOAT_DECIMAL_PLACES = 8  # Binance prices and quantities have at most 8 decimal places
+CANDLES_BATCH_MAX_SIZE = 10_000  # Lookups per candles batch request of quote consumer
+
 class Ticker(str):
     """Ticker is composed from symbol and exchange. Ex: BTCUSDT.BINANCE"""
 
@@ -26,6 +31,10 @@ class Ticker(str):
     def build(cls, symbol: Symbol, exchange: str) -> Self:
         return cls(f"{symbol}.{exchange}")
 
+    def shard(self, shards: int) -> int:
+        """Stable across processes index of the shard owning the ticker"""
+        return crc32(self.encode()) % shards
+
     @classmethod
     def __get_pydantic_core_schema__(
         cls, _source, handler: GetCoreSchemaHandler
@@ -50,6 +59,21 @@ class Ticker(str):
         return json_schema
 
 
+class Timeframe(StrEnum):
+    """Duration of the candle, candle timestamp is the start of the interval"""
+
+    S1 = "1s"
+    M1 = "1m"
+    H1 = "1h"
+
+    @property
+    def seconds(self) -> int:
+        return _TIMEFRAME_SECONDS[self]
+
+
+_TIMEFRAME_SECONDS = {Timeframe.S1: 1, Timeframe.M1: 60, Timeframe.H1: 3600}
+
+
 class Timestamp(int):
 
     @classmethod
@@ -97,11 +121,28 @@ class Candle(BaseModel):
     h: Decimal
     v: Decimal
 
-    def update(self, trade: "Trade") -> None:
-        self.v += trade.v
-        self.c = trade.p
-        self.l = min(self.l, trade.p)
-        self.h = max(self.h, trade.p)
+    @classmethod
+    def from_floats(  # noqa: PLR0913
+        cls, ticker: Ticker, timestamp: int, *, o: float, c: float, l: float, h: float, v: float
+    ) -> Self:
+        """Build candle from the compact in memory representation"""
+        return cls(
+            T=ticker,
+            t=datetime.fromtimestamp(timestamp, tz=UTC),
+            o=_float_to_decimal(o),
+            c=_float_to_decimal(c),
+            l=_float_to_decimal(l),
+            h=_float_to_decimal(h),
+            v=_float_to_decimal(v),
+        )
+
+
+class Market(BaseModel):
+    """Traded pair of the exchange, price of the ticker is the amount of quote asset for one base asset"""
+
+    T: Ticker
+    base: str
+    quote: str
 
 
 class Trade(BaseModel):
@@ -110,8 +151,20 @@ class Trade(BaseModel):
     p: Decimal
     v: Decimal
 
-    def to_candle(self) -> Candle:
-        t = datetime.fromtimestamp(self.t // 1000, tz=UTC)
-        return Candle(
-            T=self.T, t=t, o=self.p, c=self.p, h=self.p, l=self.p, v=self.v
-        )
+    def to_raw(self) -> "RawTrade":
+        return RawTrade(T=self.T, t=self.t, p=float(self.p), v=float(self.v))
+
+
+class RawTrade(NamedTuple):
+    """Trade in compact form used on the ingestion hot path"""
+
+    T: Ticker
+    t: int  # in milliseconds
+    p: float
+    v: float
+    a: int = -1  # Trade id of the exchange, increasing per ticker. -1 if the exchange has none
+
+
+def _float_to_decimal(value: float) -> Decimal:
+    # Rounding drops the float error accumulated on volume sums
+    return Decimal(repr(round(value, FLOAT_DECIMAL_PLACES)))
@@ -0,0 +1,22 @@
+import unittest
+
+from currency_conversion.services.conversion_graph import ConversionGraph, Leg
+from schemas.types import Market, Ticker
+
+_BTCUSDT = Ticker.build("BTCUSDT", "BINANCE")
+
+
+class ConversionGraphTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.graph = ConversionGraph([Market(T=_BTCUSDT, base="BTC", quote="USDT")])
+
+    def test_known_identical_pair_has_empty_route(self) -> None:
+        assert self.graph.route("BTC", "BTC") == ()
+
+    def test_unknown_identical_pair_has_no_route(self) -> None:
+        assert self.graph.route("FOO", "FOO") is None
+
+    def test_unknown_assets_are_not_kept_in_route_table(self) -> None:
+        assert self.graph.route("FOO", "USDT") is None
+        assert self.graph.route("BTC", "USDT") == (Leg(_BTCUSDT, inverse=False),)
+        assert list(self.graph._routes) == [("BTC", "USDT")]  # noqa: SLF001
@@ -0,0 +1,30 @@
+import asyncio
+import unittest
+
+from currency_conversion.services.quote_cache import CandleKey, QuoteCache
+from schemas.types import Candle, Ticker
+
+_TICKER = Ticker.build("BTCUSDT", "BINANCE")
+
+
+class QuoteCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_coalesced_waiter_resolves_when_originator_is_cancelled(self) -> None:
+        cache = QuoteCache(max_size=10, latest_ttl=1, final_after=60, final_ttl=60)
+        release = asyncio.Event()
+        candle = Candle.from_floats(_TICKER, 1, o=1, c=1, l=1, h=1, v=1)
+
+        async def fetch(keys: list[CandleKey]) -> list[Candle | None]:
+            await release.wait()
+            return [candle for _ in keys]
+
+        originator = asyncio.create_task(cache.get_many([(_TICKER, None)], fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_many([(_TICKER, None)], fetch))
+        await asyncio.sleep(0)
+        originator.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        assert await waiter == [candle]
+        assert originator.cancelled()
+        assert cache.coalesced == 1
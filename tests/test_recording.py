@@ -0,0 +1,27 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+from quote_consumer.ws_connector.recording import FrameRecorder, read_recording
+
+
+class FrameRecorderTest(unittest.TestCase):
+    def test_rotation_keeps_files_of_other_recorders(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            # Every write fills the file, so it is rotated after each of them
+            recorders = {name: FrameRecorder(directory, name, file_size=1, max_files=2) for name in ("x", "x_1", "x_10")}
+
+            async def record() -> None:
+                for idx in range(3):
+                    for name, recorder in recorders.items():
+                        recorder.add(name, f'{{"a":{idx}}}')
+                        await recorder.close()
+
+            asyncio.run(record())
+
+            assert len(list(directory.glob("x_2*"))) == 2  # noqa: PLR2004
+            assert len(list(directory.glob("x_1_*"))) == 2  # noqa: PLR2004
+            assert len(list(directory.glob("x_10_*"))) == 2  # noqa: PLR2004
+            assert {frame.connection for frame in read_recording(directory)} == {"x", "x_1", "x_10"}